@@ -30,6 +30,7 @@ setup(
     author_email     = "z@zacharyvoase.com",
     url              = 'http://github.com/zacharyvoase/django-exceptional',
     description      = "A Django client for Exceptional (getexceptional.com).",
-    packages         = ['djexceptional', 'djexceptional.tests'],
+    packages         = ['djexceptional', 'djexceptional.management',
+                        'djexceptional.management.commands', 'djexceptional.tests'],
     package_dir      = {'': 'src'},
 )
@@ -1,20 +1,35 @@
-from cStringIO import StringIO
-
+import atexit
 import datetime
-import gzip
 import inspect
 import logging
 import os
 import sys
+import time
 import traceback
 import urllib
-import urllib2
 
 from django.conf import settings
 from django.core.exceptions import MiddlewareNotUsed, ImproperlyConfigured
-from django.core.urlresolvers import resolve
-
-from djexceptional.utils import memoize, json_dumps, meta_to_http
+from django.core.urlresolvers import Resolver404, resolve
+from django.utils.importlib import import_module
+
+from djexceptional.backtrace import LazyBacktrace, capture_frames, extract_frames
+from djexceptional.compression import GzipCodec, get_codec
+from djexceptional import hooks
+from djexceptional.dedup import (Deduplicator, document_fingerprint, document_weight,
+                                 fingerprint)
+from djexceptional.delivery import QueuedDelivery, RelayDelivery, SyncDelivery
+from djexceptional.metrics import get_metrics
+from djexceptional.scrubbing import DEFAULT_PATTERNS, Scrubber
+from djexceptional.relay import MAX_MESSAGE, relay_message
+from djexceptional.sampling import Sampler
+from djexceptional.serializers import get_serializer
+from djexceptional.spool import Spool
+from djexceptional.throttle import CircuitBreaker, TokenBucket
+from djexceptional.transport import ChunkedBody, TransportError
+from djexceptional.truncation import truncate
+from djexceptional.utils import (Counters, HeaderTranslator, WeakKeyCache, memoize,
+                                 splice_json)
 
 
 __version__ = '0.1.5'
@@ -22,72 +37,604 @@ __version__ = '0.1.5'
 EXCEPTIONAL_PROTOCOL_VERSION = 6
 EXCEPTIONAL_API_ENDPOINT = getattr(settings, 'EXCEPTIONAL_API_ENDPOINT',
                                    "http://api.getexceptional.com/api/errors")
+# 'sync' sends from the request thread; 'queue' hands reports off to a pool of
+# background threads so the request never waits on the network; 'relay' writes
+# them to the socket of the host's `manage.py exceptional_relay` daemon.
+EXCEPTIONAL_DELIVERY = getattr(settings, 'EXCEPTIONAL_DELIVERY', 'sync')
+EXCEPTIONAL_RELAY_SOCKET = getattr(settings, 'EXCEPTIONAL_RELAY_SOCKET',
+                                   '/tmp/djexceptional-relay.sock')
+EXCEPTIONAL_QUEUE_SIZE = getattr(settings, 'EXCEPTIONAL_QUEUE_SIZE', 100)
+EXCEPTIONAL_QUEUE_OVERFLOW = getattr(settings, 'EXCEPTIONAL_QUEUE_OVERFLOW',
+                                     'drop-newest')
+EXCEPTIONAL_QUEUE_WORKERS = getattr(settings, 'EXCEPTIONAL_QUEUE_WORKERS', 1)
+EXCEPTIONAL_SHUTDOWN_TIMEOUT = getattr(settings, 'EXCEPTIONAL_SHUTDOWN_TIMEOUT', 5)
+# Batching only applies to queued delivery. The interval is in milliseconds.
+EXCEPTIONAL_BATCH_SIZE = getattr(settings, 'EXCEPTIONAL_BATCH_SIZE', 1)
+EXCEPTIONAL_BATCH_INTERVAL = getattr(settings, 'EXCEPTIONAL_BATCH_INTERVAL', 1000)
+# Repeats of an error within this many seconds are counted rather than sent;
+# 0 turns deduplication off. At most EXCEPTIONAL_DEDUP_SIZE errors are tracked.
+EXCEPTIONAL_DEDUP_WINDOW = getattr(settings, 'EXCEPTIONAL_DEDUP_WINDOW', 0)
+EXCEPTIONAL_DEDUP_SIZE = getattr(settings, 'EXCEPTIONAL_DEDUP_SIZE', 1000)
+# At most EXCEPTIONAL_RATE_LIMIT reports per second (in bursts of up to
+# EXCEPTIONAL_RATE_BURST) are sent from each process; None means no limit.
+EXCEPTIONAL_RATE_LIMIT = getattr(settings, 'EXCEPTIONAL_RATE_LIMIT', None)
+EXCEPTIONAL_RATE_BURST = getattr(settings, 'EXCEPTIONAL_RATE_BURST', None)
+# Report each error with probability EXCEPTIONAL_SAMPLE_RATE, or the rate given
+# for its exception class (e.g. {'django.http.Http404': 0.01}). With a target,
+# each fingerprint is also sampled down to about that many reports per
+# EXCEPTIONAL_SAMPLE_WINDOW seconds (tracking at most EXCEPTIONAL_SAMPLE_SIZE).
+EXCEPTIONAL_SAMPLE_RATE = getattr(settings, 'EXCEPTIONAL_SAMPLE_RATE', 1.0)
+EXCEPTIONAL_SAMPLE_RATES = getattr(settings, 'EXCEPTIONAL_SAMPLE_RATES', {})
+EXCEPTIONAL_SAMPLE_TARGET = getattr(settings, 'EXCEPTIONAL_SAMPLE_TARGET', None)
+EXCEPTIONAL_SAMPLE_WINDOW = getattr(settings, 'EXCEPTIONAL_SAMPLE_WINDOW', 60)
+EXCEPTIONAL_SAMPLE_SIZE = getattr(settings, 'EXCEPTIONAL_SAMPLE_SIZE', 1000)
+# After this many consecutive failures to reach the API, stop trying for
+# EXCEPTIONAL_BREAKER_TIMEOUT seconds.
+EXCEPTIONAL_BREAKER_THRESHOLD = getattr(settings, 'EXCEPTIONAL_BREAKER_THRESHOLD', 5)
+EXCEPTIONAL_BREAKER_TIMEOUT = getattr(settings, 'EXCEPTIONAL_BREAKER_TIMEOUT', 30)
+
+# Keep payloads which couldn't be delivered (or weren't tried, because the
+# circuit breaker was open) in this directory, to be sent later with
+# `manage.py exceptional_replay`; None means they're lost.
+EXCEPTIONAL_SPOOL_DIR = getattr(settings, 'EXCEPTIONAL_SPOOL_DIR', None)
+# Start a new segment file after this many bytes or seconds, and fsync() the
+# current one at most once per EXCEPTIONAL_SPOOL_SYNC_INTERVAL seconds.
+EXCEPTIONAL_SPOOL_SEGMENT_BYTES = getattr(settings, 'EXCEPTIONAL_SPOOL_SEGMENT_BYTES',
+                                          4 * 1024 * 1024)
+EXCEPTIONAL_SPOOL_SEGMENT_AGE = getattr(settings, 'EXCEPTIONAL_SPOOL_SEGMENT_AGE', 60)
+EXCEPTIONAL_SPOOL_SYNC_INTERVAL = getattr(settings, 'EXCEPTIONAL_SPOOL_SYNC_INTERVAL', 1.0)
+
+# A dotted path to the transport class, plus its timeouts in seconds.
+EXCEPTIONAL_TRANSPORT = getattr(settings, 'EXCEPTIONAL_TRANSPORT',
+                                'djexceptional.transport.HTTPTransport')
+EXCEPTIONAL_CONNECT_TIMEOUT = getattr(settings, 'EXCEPTIONAL_CONNECT_TIMEOUT', 5)
+EXCEPTIONAL_READ_TIMEOUT = getattr(settings, 'EXCEPTIONAL_READ_TIMEOUT', 10)
+# Stream each report into the compressor as it's encoded, and send it with
+# chunked transfer encoding, rather than building it up in memory first.
+EXCEPTIONAL_STREAMING = getattr(settings, 'EXCEPTIONAL_STREAMING', False)
+# How to compress reports: 'gzip', 'deflate' or 'none'. A deflate dictionary
+# only works with a collector which has been primed with the same one.
+EXCEPTIONAL_COMPRESSION = getattr(settings, 'EXCEPTIONAL_COMPRESSION', 'gzip')
+EXCEPTIONAL_COMPRESSION_LEVEL = getattr(settings, 'EXCEPTIONAL_COMPRESSION_LEVEL', 1)
+EXCEPTIONAL_COMPRESSION_DICTIONARY = getattr(settings, 'EXCEPTIONAL_COMPRESSION_DICTIONARY', None)
+# 'fast' encodes with a C-accelerated JSON library where there is one, falling
+# back to 'resilient' (the pure-Python encoder) if that fails.
+EXCEPTIONAL_SERIALIZER = getattr(settings, 'EXCEPTIONAL_SERIALIZER', 'fast')
+# Rebuild the (cached) environment info after this many seconds, e.g. to pick
+# up changes to os.environ; None means never.
+EXCEPTIONAL_ENVIRONMENT_TTL = getattr(settings, 'EXCEPTIONAL_ENVIRONMENT_TTL', None)
+# Budgets for the bulkier parts of a report, applied before it's encoded.
+# Each is a dictionary of `truncate()` arguments (see djexceptional.truncation),
+# or None for no limit; sections you don't mention keep these defaults.
+EXCEPTIONAL_PAYLOAD_LIMITS = {
+    'session': {'items': 100, 'bytes': 32768},
+    'parameters': {'items': 100, 'bytes': 32768},
+    'headers': {'items': 100, 'bytes': 16384},
+    'env': {'items': 500, 'bytes': 65536},
+    'context': {'items': 100, 'bytes': 32768},
+    'backtrace': {'items': 400, 'bytes': 65536, 'tail': True},
+}
+EXCEPTIONAL_PAYLOAD_LIMITS.update(getattr(settings, 'EXCEPTIONAL_PAYLOAD_LIMITS', {}))
+# Values whose keys match any of these regular expressions (case-insensitively)
+# are masked throughout the session, parameters, headers and environment.
+EXCEPTIONAL_SCRUB_PATTERNS = getattr(settings, 'EXCEPTIONAL_SCRUB_PATTERNS',
+                                     DEFAULT_PATTERNS)
+# Header names (case-insensitive) to leave out of reports, or, if
+# EXCEPTIONAL_HEADERS_ALLOW isn't None, the only ones to include.
+EXCEPTIONAL_HEADERS_ALLOW = getattr(settings, 'EXCEPTIONAL_HEADERS_ALLOW', None)
+EXCEPTIONAL_HEADERS_DENY = getattr(settings, 'EXCEPTIONAL_HEADERS_DENY', ())
+# Capture just the filename, line number and function of each frame while
+# handling the request, and look up source lines when the report is encoded.
+EXCEPTIONAL_LAZY_BACKTRACE = getattr(settings, 'EXCEPTIONAL_LAZY_BACKTRACE', False)
+# Also send each frame's surrounding source and a snapshot of its locals, within
+# the caps below (see `djexceptional.backtrace.capture_frames`).
+EXCEPTIONAL_STRUCTURED_BACKTRACE = getattr(settings, 'EXCEPTIONAL_STRUCTURED_BACKTRACE',
+                                           False)
+EXCEPTIONAL_FRAME_LIMITS = {
+    'frames': 20,           # Innermost frames to capture.
+    'context': 3,           # Source lines either side of each frame's line.
+    'repr_length': 200,     # Characters per local.
+    'bytes': 32768,         # For all the locals and source lines together.
+    'seconds': 0.005,       # Time to spend capturing.
+}
+EXCEPTIONAL_FRAME_LIMITS.update(getattr(settings, 'EXCEPTIONAL_FRAME_LIMITS', {}))
+# Call repr() on locals of any type, not just built-in ones; it may run your
+# code (but querysets are never evaluated).
+EXCEPTIONAL_FRAME_FULL_REPRS = getattr(settings, 'EXCEPTIONAL_FRAME_FULL_REPRS', False)
+# Where to record the time each stage of reporting takes, payload sizes and
+# outcomes: None (the default), 'memory', 'statsd' or 'log', instantiated with
+# EXCEPTIONAL_METRICS_OPTIONS (see djexceptional.metrics).
+EXCEPTIONAL_METRICS = getattr(settings, 'EXCEPTIONAL_METRICS', None)
+EXCEPTIONAL_METRICS_OPTIONS = getattr(settings, 'EXCEPTIONAL_METRICS_OPTIONS', {})
+
+# Responses to a batch POST which mean the endpoint only takes single errors.
+BATCH_UNSUPPORTED_STATUSES = (404, 405, 415)
+# Responses which might mean that, or might be down to one bad error in the
+# batch; batching is only given up after this many batches in a row get one.
+BATCH_REJECTED_STATUSES = (400, 422)
+BATCH_REJECTION_LIMIT = 2
+# Responses to a batch POST after which its errors are sent one at a time.
+BATCH_RETRY_STATUSES = (413,) + BATCH_UNSUPPORTED_STATUSES + BATCH_REJECTED_STATUSES
 
 LOG = logging.getLogger('djexceptional')
 
+SCRUBBER = Scrubber(EXCEPTIONAL_SCRUB_PATTERNS)
+HEADERS = HeaderTranslator(EXCEPTIONAL_HEADERS_ALLOW, EXCEPTIONAL_HEADERS_DENY)
 
-class ExceptionalMiddleware(object):
 
-    """
-    Middleware to interface with the Exceptional service.
+def api_endpoint(api_key):
+    """Return the URL errors are POSTed to, for the given API key."""
+
+    return EXCEPTIONAL_API_ENDPOINT + "?" + urllib.urlencode({
+        "api_key": api_key,
+        "protocol_version": EXCEPTIONAL_PROTOCOL_VERSION
+        })
+
+
+def get_transport():
+    """Instantiate the transport class named by `EXCEPTIONAL_TRANSPORT`."""
+
+    try:
+        module_name, class_name = EXCEPTIONAL_TRANSPORT.rsplit('.', 1)
+        transport_class = getattr(import_module(module_name), class_name)
+    except (ValueError, ImportError, AttributeError), exc:
+        raise ImproperlyConfigured(
+            "Couldn't import EXCEPTIONAL_TRANSPORT %r: %s" % (EXCEPTIONAL_TRANSPORT, exc))
+    return transport_class(connect_timeout=EXCEPTIONAL_CONNECT_TIMEOUT,
+                           read_timeout=EXCEPTIONAL_READ_TIMEOUT)
+
+
+def view_name(view):
+    """Work out the controller/action name pair for a Django view object."""
+
+    if inspect.isfunction(view):
+        # function_module, function_name
+        return view.__module__, view.__name__
+    elif inspect.ismethod(view):
+        # class_module.ClassName, method_name
+        return (view.im_class.__module__ + '.' + view.im_class.__name__,
+                view.__name__)
+    # class_module, ClassName
+    return view.__class__.__module__, view.__class__.__name__
+
+
+class Reporter(object):
 
-    Requires very little intervention on behalf of the user; you just need to
-    add `EXCEPTIONAL_API_KEY` to your Django settings. You can also optionally
-    set `EXCEPTIONAL_API_ENDPOINT` to change the API endpoint which will be
-    used; the default is `'http://api.getexceptional.com/api/errors'`.
     """
+    Build error reports and deliver them to Exceptional.
 
-    def __init__(self):
-        if settings.DEBUG:
-            raise MiddlewareNotUsed
+    This is everything `ExceptionalMiddleware` does, without needing a
+    request, so it can report errors from background workers, management
+    commands and the like (see `djexceptional.hooks` for the easy way to do
+    that). It's configured by the same settings as the middleware; passing
+    `delivery` overrides `EXCEPTIONAL_DELIVERY`.
+    """
 
+    def __init__(self, delivery=None):
         try:
             self.api_key = settings.EXCEPTIONAL_API_KEY
         except AttributeError:
             raise ImproperlyConfigured("You need to add an EXCEPTIONAL_API_KEY setting.")
 
-        self.api_endpoint = EXCEPTIONAL_API_ENDPOINT + "?" + urllib.urlencode({
-            "api_key": self.api_key,
-            "protocol_version": EXCEPTIONAL_PROTOCOL_VERSION
-            })
+        self.api_endpoint = api_endpoint(self.api_key)
+
+        self.counters = Counters()
+        self.sampler = None
+        if (EXCEPTIONAL_SAMPLE_RATE < 1 or EXCEPTIONAL_SAMPLE_RATES or
+                EXCEPTIONAL_SAMPLE_TARGET is not None):
+            self.sampler = Sampler(EXCEPTIONAL_SAMPLE_RATE, EXCEPTIONAL_SAMPLE_RATES,
+                                   target=EXCEPTIONAL_SAMPLE_TARGET,
+                                   window=EXCEPTIONAL_SAMPLE_WINDOW,
+                                   maxsize=EXCEPTIONAL_SAMPLE_SIZE)
+        self.limiter = None
+        if EXCEPTIONAL_RATE_LIMIT is not None:
+            self.limiter = TokenBucket(EXCEPTIONAL_RATE_LIMIT, EXCEPTIONAL_RATE_BURST)
+        self.breaker = CircuitBreaker(EXCEPTIONAL_BREAKER_THRESHOLD,
+                                      EXCEPTIONAL_BREAKER_TIMEOUT)
+        self.transport = self.get_transport()
+        try:
+            self.codec = get_codec(EXCEPTIONAL_COMPRESSION,
+                                   EXCEPTIONAL_COMPRESSION_LEVEL,
+                                   EXCEPTIONAL_COMPRESSION_DICTIONARY)
+            self.serializer = get_serializer(EXCEPTIONAL_SERIALIZER)
+            self.metrics = get_metrics(EXCEPTIONAL_METRICS, EXCEPTIONAL_METRICS_OPTIONS)
+        except ValueError, exc:
+            raise ImproperlyConfigured(str(exc))
+        # Cleared once the endpoint shows it doesn't accept batches.
+        self.accepts_batches = True
+        self.batch_rejections = 0
+        # Created before the delivery, so that it's closed after the delivery
+        # has flushed its queue at exit.
+        self.spool = None
+        if EXCEPTIONAL_SPOOL_DIR is not None:
+            self.spool = Spool(EXCEPTIONAL_SPOOL_DIR,
+                               segment_bytes=EXCEPTIONAL_SPOOL_SEGMENT_BYTES,
+                               segment_age=EXCEPTIONAL_SPOOL_SEGMENT_AGE,
+                               sync_interval=EXCEPTIONAL_SPOOL_SYNC_INTERVAL)
+            atexit.register(self.spool.close)
+        self.delivery_mode = delivery or EXCEPTIONAL_DELIVERY
+        self.delivery = self.get_delivery()
+        # Created after the delivery, so that its exit-time flush runs before
+        # the delivery is shut down. Relayed reports are deduplicated by the
+        # relay, across all the processes on the host.
+        self.deduplicator = None
+        if EXCEPTIONAL_DEDUP_WINDOW and self.delivery_mode != 'relay':
+            self.deduplicator = Deduplicator(self.delivery.submit,
+                                             window=EXCEPTIONAL_DEDUP_WINDOW,
+                                             maxsize=EXCEPTIONAL_DEDUP_SIZE)
+
+    def get_transport(self):
+        return get_transport()
+
+    def get_delivery(self):
+        """Build the delivery strategy selected by `EXCEPTIONAL_DELIVERY`."""
+
+        if self.delivery_mode == 'sync':
+            return SyncDelivery(self.send)
+        elif self.delivery_mode == 'relay':
+            # Should the relay be unusable, reports are queued rather than
+            # sent from the calling thread.
+            return RelayDelivery(self.send, EXCEPTIONAL_RELAY_SOCKET, self.relay_message,
+                                 max_message=MAX_MESSAGE,
+                                 fallback=self.get_queued_delivery,
+                                 on_drop=self.count_dropped)
+        elif self.delivery_mode == 'queue':
+            return self.get_queued_delivery()
+        raise ImproperlyConfigured(
+            "Unknown EXCEPTIONAL_DELIVERY setting: %r" % (self.delivery_mode,))
+
+    def get_queued_delivery(self):
+        try:
+            return QueuedDelivery(self.send,
+                                  maxsize=EXCEPTIONAL_QUEUE_SIZE,
+                                  overflow=EXCEPTIONAL_QUEUE_OVERFLOW,
+                                  workers=EXCEPTIONAL_QUEUE_WORKERS,
+                                  shutdown_timeout=EXCEPTIONAL_SHUTDOWN_TIMEOUT,
+                                  batch_size=EXCEPTIONAL_BATCH_SIZE,
+                                  batch_interval=EXCEPTIONAL_BATCH_INTERVAL / 1000.0,
+                                  on_drop=self.count_dropped)
+        except ValueError, exc:
+            raise ImproperlyConfigured(str(exc))
+
+    def stats(self):
 
-    def process_exception(self, request, exc):
+        """
+        Return a dictionary of counters describing what happened to reports.
+
+        `sent` and `failed` count errors we tried to send; `dropped` those shed
+        by the rate limit or a full queue; `suppressed` those skipped while the
+        circuit breaker was open; and `deduplicated` the repeats folded into
+        another report. `spooled` counts the failed or suppressed errors which
+        were saved to the spool, and `sampled_out` those sampling left out.
+        """
+
+        stats = {'sent': 0, 'failed': 0, 'dropped': 0, 'suppressed': 0,
+                 'deduplicated': 0, 'spooled': 0, 'sampled_out': 0}
+        stats.update(self.counters.snapshot())
+        return stats
+
+    def incr(self, name, amount=1):
+        """Count `amount` errors under `name`, in `stats()` and the metrics."""
+
+        self.counters.incr(name, amount)
+        if self.metrics is not None:
+            self.metrics.incr(name, amount)
+
+    def count_dropped(self):
+        """Count a report the delivery dropped (e.g. because its queue was full)."""
+
+        self.incr('dropped')
+
+    def report(self, exc_info=None, context=None, request=None):
+
+        """
+        Report an exception: by default, the one currently being handled.
+
+        `exc_info` is a `(type, value, traceback)` triple, as returned by
+        `sys.exc_info()`. `context` is an optional dictionary of anything else
+        worth knowing, sent (scrubbed and truncated) as the report's `context`
+        section; `request` adds the usual request section.
+        """
+
+        if exc_info is None:
+            exc_info = sys.exc_info()
+        if exc_info[1] is None:
+            return
+        self.process(exc_info[1], exc_info[2], request, context)
+
+    def process(self, exc, tb, request=None, context=None):
+        error_fingerprint = None
+        weight = 1
+        if self.sampler is not None:
+            if self.sampler.adaptive:
+                error_fingerprint = self.error_fingerprint(request, exc, tb)
+            weight = self.sampler.sample(self.exception_class(exc), error_fingerprint)
+            if weight is None:
+                self.incr('sampled_out')
+                return
+
+        if self.deduplicator is not None:
+            # Count a repeat before any work goes into a report of it.
+            if error_fingerprint is None:
+                error_fingerprint = self.error_fingerprint(request, exc, tb)
+            if self.deduplicator.repeat(error_fingerprint, weight=weight):
+                self.incr('deduplicated')
+                return
+
+        # Only reports which would actually be sent count towards the limit.
+        if self.limiter is not None and not self.limiter.consume():
+            self.incr('dropped')
+            return
+
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.time()
+
+        # The environment is spliced in at serialization time; see `serialize()`.
         info = {}
-        info.update(self.environment_info())
-        info.update(self.request_info(request))
-        info.update(self.exception_info(exc, sys.exc_info()[2]))
+        if request is not None:
+            info.update(self.request_info(request))
+        info.update(self.exception_info(exc, tb))
+        if context:
+            info["context"] = self.clean_section('context', context)
+        if weight != 1:
+            # Each report sent stands for `weight` errors.
+            info["sampling"] = {"rate": 1.0 / weight, "weight": weight}
 
-        payload = self.compress(json_dumps(info))
-        req = urllib2.Request(self.api_endpoint, data=payload)
-        req.headers['Content-Encoding'] = 'gzip'
-        req.headers['Content-Type'] = 'application/json'
+        if metrics is not None:
+            metrics.timing('build', time.time() - start)
+        self.submit(info, error_fingerprint, weight)
 
-        try:
-            conn = urllib2.urlopen(req)
+    def error_fingerprint(self, request, exception, tb):
+
+        """
+        Fingerprint an error before its report has been built.
+
+        This only walks the traceback, and gives the same result as
+        `document_fingerprint()` on the finished report (unless its backtrace
+        was truncated).
+        """
+
+        view = None
+        if request is not None:
+            view = self.resolve_view(request)[0]
+        if view is None:
+            view_name = ("", "")
+        else:
+            view_name = self.get_view_name(view)
+        return fingerprint(self.exception_class(exception), view_name,
+                           LazyBacktrace(extract_frames(tb)))
+
+    def submit(self, document, fingerprint=None, weight=None):
+
+        """
+        Deduplicate an error document (if that's on), then deliver it.
+
+        `document` may already be serialized (as it is when it comes from
+        another process through the relay), in which case its `fingerprint`
+        and sampling `weight` must be given too.
+        """
+
+        if self.deduplicator is not None:
+            if fingerprint is None:
+                fingerprint = document_fingerprint(document)
+            if weight is None:
+                weight = document_weight(document)
+            if self.deduplicator.observe(fingerprint, document, weight=weight):
+                self.incr('deduplicated')
+                return
+        if self.metrics is None:
+            self.delivery.submit(document)
+            return
+        start = time.time()
+        self.delivery.submit(document)
+        self.metrics.timing('enqueue', time.time() - start)
+
+    def relay_message(self, document):
+        """Serialize a document as a message for the relay daemon."""
+
+        return relay_message(document_fingerprint(document), self.serialize(document),
+                             document_weight(document))
+
+    def send(self, documents):
+
+        """
+        Serialize, compress and POST a list of error documents.
+
+        Several documents are sent as a single JSON array in one request. If
+        the endpoint turns that down, they're split back into one protocol
+        request each. Batches aren't tried again once the endpoint says it
+        doesn't take them, or has rejected `BATCH_REJECTION_LIMIT` in a row.
+        """
+
+        if len(documents) > 1 and self.accepts_batches:
             try:
-                conn.read()
-            finally:
-                conn.close()
+                self.post(self.encode(documents), len(documents), documents,
+                          retried_statuses=BATCH_RETRY_STATUSES)
+                self.batch_rejections = 0
+                return
+            except TransportError, exc:
+                if exc.status == 413:
+                    LOG.warning("Batch of %d errors was too large; "
+                                "sending them one at a time", len(documents))
+                elif exc.status in BATCH_RETRY_STATUSES:
+                    self.batch_rejections += 1
+                    if (exc.status in BATCH_UNSUPPORTED_STATUSES or
+                            self.batch_rejections >= BATCH_REJECTION_LIMIT):
+                        LOG.warning("Exceptional endpoint rejected a batch (HTTP %d); "
+                                    "sending errors one at a time", exc.status)
+                        self.accepts_batches = False
+                    else:
+                        LOG.warning("Exceptional endpoint rejected a batch (HTTP %d); "
+                                    "sending its errors one at a time", exc.status)
+                else:
+                    LOG.exception("Error communicating with the Exceptional service: %r", exc)
+                    return
+            except Exception, exc:
+                LOG.exception("Error communicating with the Exceptional service: %r", exc)
+                return
+
+        for document in documents:
+            try:
+                self.post(self.encode([document]))
+            except Exception, exc:
+                LOG.exception("Error communicating with the Exceptional service: %r", exc)
+
+    def post(self, payload, count=1, documents=None, retried_statuses=()):
+
+        """
+        POST a compressed JSON payload of `count` errors to the API endpoint.
+
+        Nothing is sent while the circuit breaker is open. Connection errors
+        and 5xx responses count towards opening it. With a spool, payloads
+        which aren't sent for either reason are saved to it rather than lost,
+        and no error is raised; a batch is saved as its `documents`. A 4xx
+        response in `retried_statuses` isn't counted as a failure, since the
+        caller will send the errors again.
+        """
+
+        headers = self.codec.headers()
+        headers['Content-Type'] = 'application/json'
+        if not self.breaker.allow():
+            self.incr('suppressed', count)
+            self.save(payload, headers, count, documents)
+            return
+
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.time()
+        try:
+            self.transport.post(self.api_endpoint, payload, headers)
         except Exception, exc:
-            LOG.exception("Error communicating with the Exceptional service: %r", exc)
+            if metrics is not None:
+                metrics.timing('send', time.time() - start)
+            if isinstance(exc, TransportError) and exc.status < 500:
+                # The service is up; it just didn't like this payload.
+                self.breaker.record_success()
+                if exc.status not in retried_statuses:
+                    self.incr('failed', count)
+                raise
+            self.incr('failed', count)
+            if self.breaker.record_failure():
+                LOG.warning("Couldn't reach the Exceptional service %d times in a row; "
+                            "not reporting errors for %s seconds",
+                            self.breaker.failures, self.breaker.reset_timeout)
+            if self.save(payload, headers, count, documents):
+                LOG.warning("Error communicating with the Exceptional service (%r); "
+                            "spooled %d errors", exc, count)
+                return
+            raise
+
+        if metrics is not None:
+            metrics.timing('send', time.time() - start)
+        self.breaker.record_success()
+        self.incr('sent', count)
+
+    def save(self, payload, headers, count, documents=None):
+
+        """
+        Append an unsent payload to the spool, if there is one.
+
+        If the payload is a batch of several `documents`, they're encoded and
+        saved one by one instead, so they can be replayed to an endpoint which
+        doesn't accept batches. Returns whether everything was saved.
+        """
+
+        if self.spool is None:
+            return False
+        if documents is not None and len(documents) > 1:
+            records = [(self.encode([document]), 1) for document in documents]
+        else:
+            records = [(payload, count)]
+        saved = 0
+        try:
+            for payload, record_count in records:
+                if isinstance(payload, ChunkedBody):
+                    payload = ''.join(payload)
+                self.spool.append(payload, headers, record_count)
+                saved += record_count
+        except Exception, exc:
+            LOG.exception("Couldn't spool %d errors: %r", count - saved, exc)
+        if saved:
+            self.incr('spooled', saved)
+        return saved == count
+
+    def encode(self, documents):
+
+        """
+        Return the compressed request body for a list of error documents.
+
+        A single document is encoded as a JSON object, and several as an
+        array. With `EXCEPTIONAL_STREAMING` on, this is a `ChunkedBody`.
+        """
+
+        if EXCEPTIONAL_STREAMING:
+            return ChunkedBody(
+                lambda: self.codec.compress_chunks(self.iter_serialize(documents)))
+        if len(documents) == 1:
+            body = self.serialize(documents[0])
+        else:
+            body = "[" + ",".join(map(self.serialize, documents)) + "]"
+        if self.metrics is None:
+            return self.codec.compress(body)
+
+        start = time.time()
+        payload = self.codec.compress(body)
+        self.metrics.timing('compress', time.time() - start)
+        self.metrics.histogram('bytes.compressed', len(payload))
+        return payload
+
+    def serialize(self, document):
+
+        """
+        Encode an error document, plus the environment info, as JSON.
+
+        Documents which are already strings were serialized by another
+        process (see `djexceptional.relay`), and are returned as they are.
+        """
+
+        if isinstance(document, basestring):
+            return document
+        if self.metrics is None:
+            return splice_json(self.environment_json(), self.serializer.dumps(document))
+
+        start = time.time()
+        json = splice_json(self.environment_json(), self.serializer.dumps(document))
+        self.metrics.timing('serialize', time.time() - start)
+        self.metrics.histogram('bytes.raw', len(json))
+        return json
+
+    def iter_serialize(self, documents):
+        """Like `serialize()`, but yields the JSON for `encode()` piecemeal."""
+
+        if len(documents) > 1:
+            yield "["
+        for i, document in enumerate(documents):
+            if i:
+                yield ","
+            if isinstance(document, basestring):
+                yield document
+                continue
+            yield "{" + self.environment_json()
+            chunks = iter(self.serializer.iterencode(document))
+            # Swap the document's opening brace for a separating comma.
+            head = chunks.next()[1:]
+            if not head.startswith("}"):
+                head = ", " + head
+            yield head
+            for chunk in chunks:
+                yield chunk
+        if len(documents) > 1:
+            yield "]"
 
     @staticmethod
     def compress(bytes):
         """Compress a bytestring using gzip."""
 
-        stream = StringIO()
-        # Use `compresslevel=1`; it's the least compressive but it's fast.
-        gzstream = gzip.GzipFile(fileobj=stream, compresslevel=1, mode='wb')
-        try:
-            try:
-                gzstream.write(bytes)
-            finally:
-                gzstream.close()
-            return stream.getvalue()
-        finally:
-            stream.close()
+        # Use level 1; it's the least compressive but it's fast.
+        return GzipCodec(1).compress(bytes)
 
-    @memoize
+    @memoize(ttl=EXCEPTIONAL_ENVIRONMENT_TTL)
     def environment_info(self):
 
         """
@@ -95,13 +642,14 @@ class ExceptionalMiddleware(object):
 
         The idea is that the result of this function will rarely (if ever)
         change for a given app instance. Ergo, the result can be cached between
-        requests.
+        requests (for up to `EXCEPTIONAL_ENVIRONMENT_TTL` seconds, if that's
+        set).
         """
 
         return {
                 "application_environment": {
                     "framework": "django",
-                    "env": dict(os.environ),
+                    "env": self.clean_section('env', dict(os.environ)),
                     "language": "python",
                     "language_version": sys.version.replace('\n', ''),
                     "application_root_directory": self.project_root()
@@ -113,6 +661,20 @@ class ExceptionalMiddleware(object):
                     }
                 }
 
+    @memoize(ttl=EXCEPTIONAL_ENVIRONMENT_TTL)
+    def environment_json(self):
+
+        """
+        Return `environment_info()` encoded as the members of a JSON object.
+
+        `os.environ` alone can run to hundreds of variables, so this is only
+        encoded once per process, and spliced into each error document as it
+        is serialized. It's cleared along with `environment_info`.
+        """
+
+        return self.serializer.dumps(self.environment_info())[1:-1]
+    environment_info.on_clear(environment_json.clear)
+
     def request_info(self, request):
 
         """
@@ -121,41 +683,66 @@ class ExceptionalMiddleware(object):
         This will be run once for every request.
         """
 
-        # We have to re-resolve the request path here, because the information
-        # is not stored on the request.
-        view, args, kwargs = resolve(request.path)
+        view, args, kwargs = self.resolve_view(request)
+        kwargs = dict(kwargs)
         for i, arg in enumerate(args):
             kwargs[i] = arg
 
-        view_name = self.get_view_name(view)
+        if view is None:
+            view_name = ("", "")
+        else:
+            view_name = self.get_view_name(view)
 
         parameters = {}
         parameters.update(kwargs)
         parameters.update(request.POST.items())
-        parameters = self.filter_params(parameters)
 
         return {
                 "request": {
-                    "session": dict(request.session),
+                    "session": self.clean_section('session', dict(request.session)),
                     "remote_ip": request.META["REMOTE_ADDR"],
-                    "parameters": parameters,
+                    "parameters": self.clean_section('parameters', parameters),
                     "controller": view_name[0],
                     "action": view_name[1],
                     "url": request.build_absolute_uri(),
                     "request_method": request.method,
-                    "headers": meta_to_http(request.META)
+                    "headers": self.clean_section('headers', HEADERS(request.META))
                     }
                 }
 
+    @staticmethod
+    def resolve_view(request):
+
+        """
+        Return the `(view, args, kwargs)` a request was dispatched to.
+
+        This is normally recorded by `process_view()`; if that didn't run (say
+        another middleware returned early), the URL is resolved again. If
+        *that* fails, the view is `None`.
+        """
+
+        if hasattr(request, '_exceptional_view'):
+            return request._exceptional_view
+        try:
+            return resolve(getattr(request, 'path_info', request.path),
+                           getattr(request, 'urlconf', None))
+        except Resolver404:
+            return None, (), {}
+
     def exception_info(self, exception, tb, timestamp=None):
-        backtrace = []
-        for tb_part in traceback.format_tb(tb):
-            backtrace.extend(tb_part.rstrip().splitlines())
+        if EXCEPTIONAL_LAZY_BACKTRACE:
+            backtrace = LazyBacktrace(extract_frames(tb),
+                                      EXCEPTIONAL_PAYLOAD_LIMITS.get('backtrace'))
+        else:
+            backtrace = []
+            for tb_part in traceback.format_tb(tb):
+                backtrace.extend(tb_part.rstrip().splitlines())
+            backtrace = self.clean_section('backtrace', backtrace)
 
         if timestamp is None:
             timestamp = datetime.datetime.utcnow()
 
-        return {
+        info = {
                 "exception": {
                     # Naively assume all times are in UTC.
                     "occurred_at": timestamp.isoformat() + 'Z',
@@ -165,6 +752,31 @@ class ExceptionalMiddleware(object):
                     }
                 }
 
+        if EXCEPTIONAL_STRUCTURED_BACKTRACE:
+            frames, truncated = capture_frames(tb, scrubber=SCRUBBER,
+                                               full_reprs=EXCEPTIONAL_FRAME_FULL_REPRS,
+                                               **EXCEPTIONAL_FRAME_LIMITS)
+            info["exception"]["frames"] = frames
+            if truncated:
+                info["exception"]["frames_truncated"] = truncated
+
+        return info
+
+    @staticmethod
+    def clean_section(section, value):
+
+        """
+        Prepare a section of the payload for sending.
+
+        The section is truncated to its `EXCEPTIONAL_PAYLOAD_LIMITS`, then
+        sensitive values are masked (see `djexceptional.scrubbing`).
+        """
+
+        limits = EXCEPTIONAL_PAYLOAD_LIMITS.get(section)
+        if limits is not None:
+            value = truncate(value, **limits)
+        return SCRUBBER.scrub(value)
+
     def exception_class(self, exception):
         """Return a name representing the class of an exception."""
 
@@ -193,23 +805,56 @@ class ExceptionalMiddleware(object):
 
     @staticmethod
     def get_view_name(view):
-        """Resolve a Django view object into a controller/action name pair."""
-
-        if inspect.isfunction(view):
-            # function_module, function_name
-            return view.__module__, view.__name__
-        elif inspect.ismethod(view):
-            # class_module.ClassName, method_name
-            return (view.im_class.__module__ + '.' + view.im_class.__name__,
-                    view.__name__)
-        # class_module, ClassName
-        return view.__class__.__module__, view.__class__.__name__
+
+        """
+        Resolve a Django view object into a controller/action name pair.
+
+        The pairs are cached per view object; see `view_name_cache.stats()`
+        for how well that's working.
+        """
+
+        return Reporter.view_name_cache(view)
+
+    view_name_cache = WeakKeyCache(view_name)
 
     @staticmethod
     def filter_params(params):
         """Filter sensitive information out of parameter dictionaries."""
 
-        for key in params.keys():
-            if "password" in key:
-                del params[key]
-        return params
+        return SCRUBBER.scrub(params)
+
+
+class ExceptionalMiddleware(Reporter):
+
+    """
+    Middleware to interface with the Exceptional service.
+
+    Requires very little intervention on behalf of the user; you just need to
+    add `EXCEPTIONAL_API_KEY` to your Django settings. You can also optionally
+    set `EXCEPTIONAL_API_ENDPOINT` to change the API endpoint which will be
+    used; the default is `'http://api.getexceptional.com/api/errors'`.
+
+    Set `EXCEPTIONAL_DELIVERY = 'queue'` to send reports from background
+    threads instead of the request thread, or `'relay'` to hand them to a
+    daemon shared by every process on the host; see `djexceptional.delivery`.
+    Passing `delivery` overrides the setting.
+
+    The first middleware created in a process is also used by
+    `djexceptional.hooks`, so errors reported outside of requests share its
+    delivery.
+    """
+
+    def __init__(self, delivery=None):
+        if settings.DEBUG:
+            raise MiddlewareNotUsed
+
+        super(ExceptionalMiddleware, self).__init__(delivery)
+        hooks.set_default_reporter(self, replace=False)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Remember the view Django resolved, so `request_info()` doesn't have
+        # to resolve the URL all over again.
+        request._exceptional_view = (view_func, view_args, view_kwargs)
+
+    def process_exception(self, request, exc):
+        self.process(exc, sys.exc_info()[2], request)
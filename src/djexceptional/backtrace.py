@@ -0,0 +1,285 @@
+"""Capturing backtraces cheaply, and formatting them later."""
+
+from repr import Repr
+
+import array
+import collections
+import datetime
+import decimal
+import itertools
+import linecache
+import time
+import types
+
+from djexceptional.truncation import truncate
+from djexceptional.utils import LRUCache
+
+
+# Source lines, keyed by `(filename, lineno)`.
+SOURCE_LINES = LRUCache(10000)
+
+# Types whose `repr()` is cheap and runs no application code. Locals of any
+# other type (unless they're containers) get a placeholder, unless full reprs
+# are asked for.
+SAFE_REPR_TYPES = frozenset([
+    bool, int, long, float, complex, type(None), types.NotImplementedType,
+    types.EllipsisType, slice, xrange, type, types.ClassType, types.ModuleType,
+    types.FunctionType, types.BuiltinFunctionType, types.MethodType, types.CodeType,
+    datetime.date, datetime.datetime, datetime.time, datetime.timedelta,
+    decimal.Decimal,
+])
+
+# Types `Repr` knows how to abbreviate.
+CONTAINER_TYPES = frozenset([
+    str, tuple, list, dict, set, frozenset, collections.deque, array.array,
+])
+
+
+def extract_frames(tb):
+    """Return `(filename, lineno, name)` for each frame of a traceback."""
+
+    frames = []
+    while tb is not None:
+        code = tb.tb_frame.f_code
+        frames.append((code.co_filename, tb.tb_lineno, code.co_name))
+        tb = tb.tb_next
+    return frames
+
+
+def source_line(filename, lineno):
+    """Return the stripped source of a line, cached per `(filename, lineno)`."""
+
+    key = (filename, lineno)
+    line = SOURCE_LINES.get(key)
+    if line is None:
+        line = linecache.getline(filename, lineno).strip()
+        SOURCE_LINES.put(key, line)
+    return line
+
+
+def frame_line(frame):
+    return 'File "%s", line %d, in %s' % frame
+
+
+class LazyBacktrace(object):
+
+    """
+    A backtrace captured as frame summaries, and formatted when it's encoded.
+
+    Capturing only walks the traceback; reading source lines (through
+    `linecache`) and formatting happen in `for_json()`, which the JSON
+    encoders call, so when reports are queued that work moves off the request
+    thread. The formatted lines are the same as `traceback.format_tb()`'s,
+    and are truncated with `limits` (see `djexceptional.truncation`).
+    """
+
+    def __init__(self, frames, limits=None):
+        self.frames = frames
+        self.limits = limits
+
+    def frame_lines(self):
+        """Return just the `File "...", line N, in f` lines (for fingerprinting)."""
+
+        return [frame_line(frame) for frame in self.frames]
+
+    def format(self):
+        lines = []
+        for frame in self.frames:
+            lines.append('  ' + frame_line(frame))
+            source = source_line(frame[0], frame[1])
+            if source:
+                lines.append('    ' + source)
+        return lines
+
+    def for_json(self):
+        lines = self.format()
+        if self.limits is not None:
+            lines = truncate(lines, **self.limits)
+        return lines
+
+
+def capture_frames(tb, frames=20, context=3, repr_length=200, bytes=32768,
+                   seconds=0.005, scrubber=None, full_reprs=False):
+
+    """
+    Return a structured backtrace, with a snapshot of each frame's locals.
+
+    Each frame is a dictionary of `filename`, `function`, `lineno`, `context`
+    (`pre`, `line` and `post`, with up to `context` lines either side) and
+    `locals`, mapping names to `repr()`s cut to `repr_length` characters.
+    Containers are only `repr()`ed as far as needed, so a huge list costs no
+    more than a small one. Objects other than built-in scalars (which might
+    run a query, like a `QuerySet`, or format something huge) are shown as
+    `<module.Class object at 0x...>`, unless `full_reprs`; even then,
+    querysets aren't evaluated.
+
+    The cost is capped: only the innermost `frames` frames are captured,
+    innermost first, and capture stops once the reprs add up to `bytes` or
+    `seconds` have passed. Returns the frames (outermost first) and, if
+    anything was left out, a string saying why; otherwise `None`.
+
+    Locals whose names `scrubber` finds sensitive are masked without being
+    `repr()`ed at all, as are the values of sensitive keys in dictionaries, at
+    any depth.
+
+    Source lines count towards `bytes` too, and are cut to `repr_length`
+    characters.
+    """
+
+    start = time.time()
+    repr_ = _LimitedRepr(repr_length, full_reprs, scrubber).repr
+
+    stack = []
+    while tb is not None:
+        stack.append((tb.tb_frame, tb.tb_lineno))
+        tb = tb.tb_next
+
+    truncated = None
+    if len(stack) > frames:
+        truncated = "%d outer frames omitted" % (len(stack) - frames)
+        stack = stack[-frames:]
+
+    captured = []
+    budget = bytes
+    for frame, lineno in reversed(stack):
+        if budget <= 0 or time.time() - start > seconds:
+            truncated = "budget exhausted after %d of %d frames" % (
+                len(captured), len(stack))
+            break
+
+        code = frame.f_code
+        local_reprs = {}
+        for name, value in frame.f_locals.items():
+            if budget <= 0 or time.time() - start > seconds:
+                local_reprs['__truncated__'] = True
+                break
+            if scrubber is not None and scrubber.is_sensitive(name):
+                value_repr = scrubber.mask
+            else:
+                value_repr = repr_(value)
+            local_reprs[name] = value_repr
+            budget -= len(name) + len(value_repr)
+
+        frame_context = _context(code.co_filename, lineno, context, repr_length)
+        for line in frame_context["pre"] + [frame_context["line"]] + frame_context["post"]:
+            budget -= len(line)
+
+        captured.append({
+            "filename": code.co_filename,
+            "function": code.co_name,
+            "lineno": lineno,
+            "context": frame_context,
+            "locals": local_reprs,
+        })
+
+    captured.reverse()
+    return captured, truncated
+
+
+def _context(filename, lineno, size, length):
+    lines = linecache.getlines(filename)
+    index = lineno - 1
+    if not 0 <= index < len(lines):
+        return {"pre": [], "line": "", "post": []}
+
+    def clean(line):
+        line = line.rstrip()
+        if len(line) > length:
+            line = line[:length] + '...'
+        return line
+    return {
+        "pre": [clean(line) for line in lines[max(0, index - size):index]],
+        "line": clean(lines[index]),
+        "post": [clean(line) for line in lines[index + 1:index + 1 + size]],
+    }
+
+
+class _LimitedRepr(Repr):
+
+    """
+    A `Repr` which never fails, and never returns more than `length`
+    characters. Only with `full` does it call `repr()` on arbitrary objects.
+    Dictionary values under keys `scrubber` finds sensitive are masked.
+    """
+
+    def __init__(self, length, full=False, scrubber=None):
+        Repr.__init__(self)
+        self.maxstring = self.maxother = self.maxlong = length
+        self.full = full
+        self.scrubber = scrubber
+
+    def repr(self, obj):
+        try:
+            value = Repr.repr(self, obj)
+        except Exception:
+            value = object.__repr__(obj)
+        if len(value) > self.maxstring:
+            value = value[:self.maxstring] + '...'
+        return value
+
+    def repr1(self, obj, level):
+        # `Repr` calls `repr()` on anything it doesn't know; we don't.
+        if type(obj) in CONTAINER_TYPES:
+            return Repr.repr1(self, obj, level)
+        return self.repr_instance(obj, level)
+
+    def repr_dict(self, obj, level):
+        if not obj:
+            return '{}'
+        if level <= 0:
+            return '{...}'
+        pieces = []
+        for key in itertools.islice(_possibly_sorted(obj), self.maxdict):
+            if self.scrubber is not None and self.scrubber.is_sensitive(key):
+                value_repr = self.scrubber.mask
+            else:
+                value_repr = self.repr1(obj[key], level - 1)
+            pieces.append('%s: %s' % (self.repr1(key, level - 1), value_repr))
+        if len(obj) > self.maxdict:
+            pieces.append('...')
+        return '{%s}' % ', '.join(pieces)
+
+    def repr_unicode(self, obj, level):
+        value = repr(obj[:self.maxstring + 1])
+        if len(obj) > self.maxstring:
+            value = value[:self.maxstring] + '...'
+        return value
+
+    def repr_instance(self, obj, level):
+        if isinstance(obj, basestring):
+            # A subclass, such as Django's `SafeString`.
+            return self.repr_unicode(obj, level)
+        cls = type(obj)
+        if cls is types.InstanceType:
+            cls = obj.__class__
+        if cls not in SAFE_REPR_TYPES and (not self.full or _is_queryset(obj)):
+            return '<%s.%s object at %#x>' % (cls.__module__, cls.__name__, id(obj))
+        if isinstance(obj, dict) and self.scrubber is not None:
+            # A subclass, such as a `QueryDict`, whose own `repr()` wouldn't
+            # mask anything.
+            return '%s(%s)' % (cls.__name__, self.repr_dict(obj, level))
+
+        # `Repr` silently swallows errors here; we'd rather know what it was.
+        try:
+            value = repr(obj)
+        except Exception, exc:
+            return '<%s instance; repr() failed: %r>' % (type(obj).__name__, exc)
+        if len(value) > self.maxother:
+            value = value[:self.maxother] + '...'
+        return value
+
+
+def _possibly_sorted(obj):
+    # Like `Repr`, sort keys when they can be sorted.
+    try:
+        return sorted(obj)
+    except Exception:
+        return list(obj)
+
+
+def _is_queryset(obj):
+    try:
+        from django.db.models.query import QuerySet
+    except ImportError:
+        return False
+    return isinstance(obj, QuerySet)
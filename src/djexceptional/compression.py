@@ -0,0 +1,170 @@
+"""Codecs for compressing report payloads."""
+
+import zlib
+
+
+# Strings which turn up in every report. Priming a `DeflateCodec` with these
+# lets even the first occurrence of each be encoded as a back-reference.
+DEFAULT_DICTIONARY = (
+    '{"application_environment": {"framework": "django", "env": {}, '
+    '"language": "python", "language_version": "", '
+    '"application_root_directory": ""}, "client": {"name": "django-exceptional", '
+    '"version": "", "protocol_version": 6}, "request": {"session": {}, '
+    '"remote_ip": "", "parameters": {}, "controller": "", "action": "", '
+    '"url": "http://", "request_method": "GET", "headers": {"Content-Type": '
+    '"Content-Length": "Host": "User-Agent": "Accept": "Accept-Encoding": '
+    '"Accept-Language": "Cookie": "Referer": "X-Forwarded-For": }}, '
+    '"exception": {"occurred_at": "", "message": "", "backtrace": '
+    '["File \\"", "\\", line ", ", in "], "exception_class": ""}}'
+)
+
+
+class NullCodec(object):
+
+    """
+    Send payloads uncompressed.
+
+    This is the base class for the other codecs, which only need to override
+    `compressobj()` and `content_encoding`.
+    """
+
+    content_encoding = None
+
+    def compressobj(self):
+        """Return a fresh object with zlib's `compress()`/`flush()` interface."""
+
+        return _Identity()
+
+    def headers(self):
+        """Return any HTTP headers a payload needs to be decompressed."""
+
+        if self.content_encoding is None:
+            return {}
+        return {'Content-Encoding': self.content_encoding}
+
+    def compress(self, data):
+        compressor = self.compressobj()
+        return compressor.compress(data) + compressor.flush()
+
+    def compress_chunks(self, chunks, buffer_size=16384):
+
+        """
+        Compress an iterable of bytestrings, yielding the output as it's made.
+
+        The output is buffered into pieces of at least `buffer_size` bytes
+        (apart from the last one), so it isn't split into lots of tiny writes.
+        """
+
+        compressor = self.compressobj()
+        buffer, size = [], 0
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                buffer.append(data)
+                size += len(data)
+                if size >= buffer_size:
+                    yield ''.join(buffer)
+                    buffer, size = [], 0
+        buffer.append(compressor.flush())
+        yield ''.join(buffer)
+
+
+class GzipCodec(NullCodec):
+
+    """Gzip payloads; level 1 is the least compressive, but it's fast."""
+
+    content_encoding = 'gzip'
+
+    def __init__(self, level=1):
+        self.level = level
+
+    def compressobj(self):
+        # `16 + MAX_WBITS` asks zlib for a gzip header and trailer.
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class DeflateCodec(NullCodec):
+
+    """
+    Compress payloads with deflate, optionally with a dictionary.
+
+    Without a dictionary, payloads are zlib streams, which is what HTTP's
+    `Content-Encoding: deflate` means.
+
+    A preset dictionary is a string of data the compressor pretends to have
+    already seen, so a payload which repeats parts of it costs only
+    back-references. Only the last 32KB of it are in the compressor's reach.
+    No standard receiver can read such a payload, so it's sent as a raw
+    deflate stream under the made-up `Content-Encoding: x-deflate-dict`. The
+    receiver needs to be primed with the same dictionary; see `decompress()`.
+    An `X-Exceptional-Dictionary` header carries the dictionary's Adler-32
+    checksum so it can tell which one was used.
+    """
+
+    content_encoding = 'deflate'
+
+    def __init__(self, level=1, dictionary=None):
+        self.level = level
+        self.dictionary = dictionary
+        self._primed = None
+        self._prefix = ''
+        if dictionary:
+            self.content_encoding = 'x-deflate-dict'
+            # The zlib module has no way to set a dictionary, so we compress
+            # the dictionary itself and sync-flush, which leaves the stream on
+            # a byte boundary. Copies of that compressor then produce exactly
+            # what a dictionary-primed one would, once the prefix is stripped.
+            self._primed = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            self._prefix = (self._primed.compress(dictionary[-32768:]) +
+                            self._primed.flush(zlib.Z_SYNC_FLUSH))
+
+    def compressobj(self):
+        if self._primed is None:
+            return zlib.compressobj(self.level, zlib.DEFLATED, zlib.MAX_WBITS)
+        return self._primed.copy()
+
+    def headers(self):
+        headers = super(DeflateCodec, self).headers()
+        if self.dictionary:
+            headers['X-Exceptional-Dictionary'] = '%08x' % (
+                zlib.adler32(self.dictionary[-32768:]) & 0xffffffff)
+        return headers
+
+    def decompress(self, data):
+        """Decompress a payload made by this codec (for use by a receiver)."""
+
+        if self._primed is None:
+            return zlib.decompress(data)
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        decompressor.decompress(self._prefix)
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+class _Identity(object):
+
+    def compress(self, data):
+        return data
+
+    def flush(self):
+        return ''
+
+
+CODECS = {
+    'none': NullCodec,
+    'gzip': GzipCodec,
+    'deflate': DeflateCodec,
+}
+
+
+def get_codec(name, level=1, dictionary=None):
+    """Look up a codec by name (`'gzip'`, `'deflate'` or `'none'`)."""
+
+    try:
+        codec_class = CODECS[name]
+    except KeyError:
+        raise ValueError("Unknown compression codec: %r" % (name,))
+    if codec_class is NullCodec:
+        return NullCodec()
+    elif codec_class is DeflateCodec:
+        return DeflateCodec(level, dictionary)
+    return codec_class(level)
@@ -0,0 +1,234 @@
+"""Collapse repeated occurrences of the same error into a single report."""
+
+import atexit
+import datetime
+import logging
+import os
+import threading
+import time
+
+from django.utils.hashcompat import sha_constructor
+
+from djexceptional.backtrace import LazyBacktrace
+from djexceptional.utils import LRUCache, json_dumps, splice_json
+
+
+LOG = logging.getLogger('djexceptional')
+
+
+def normalize_backtrace(backtrace):
+
+    """
+    Reduce formatted backtrace lines to their `File "...", line N, in f` parts.
+
+    The source lines in between add nothing to an error's identity, and may
+    change (or disappear) when the code is redeployed.
+    """
+
+    if isinstance(backtrace, LazyBacktrace):
+        return backtrace.frame_lines()
+    return [line.strip() for line in backtrace
+            if line.lstrip().startswith('File "')]
+
+
+def fingerprint(exception_class, view_name, backtrace):
+    """Return a hex digest identifying an error by its class, view and backtrace."""
+
+    parts = [exception_class, view_name[0], view_name[1]]
+    parts.extend(normalize_backtrace(backtrace))
+    return sha_constructor("\n".join(parts).encode('utf-8')).hexdigest()
+
+
+def document_fingerprint(document):
+    """Fingerprint a complete error document (which may not have a request)."""
+
+    request = document.get("request", {})
+    return fingerprint(document["exception"]["exception_class"],
+                       (request.get("controller", ""), request.get("action", "")),
+                       document["exception"]["backtrace"])
+
+
+def document_weight(document):
+    """Return the number of errors a complete error document stands for."""
+
+    return document.get("sampling", {}).get("weight", 1)
+
+
+class Occurrence(object):
+
+    """
+    The first report of an error, plus a count of its repeats and the total
+    of their sampling weights.
+    """
+
+    def __init__(self, document, now):
+        self.document = document
+        self.first_seen = self.last_seen = now
+        self.count = 0
+        self.weight = 0
+
+    def add(self, now, weight=1):
+        self.count += 1
+        self.weight += weight
+        self.last_seen = now
+
+    def aggregate(self):
+
+        """
+        Return a copy of the first report, annotated with the repeats.
+
+        A report which is already JSON (as the relay keeps them) gets the
+        annotation spliced in, without being decoded.
+        """
+
+        occurrences = {
+            "count": self.count,
+            "weight": self.weight,
+            "first_seen": _isoformat(self.first_seen),
+            "last_seen": _isoformat(self.last_seen),
+        }
+        if isinstance(self.document, basestring):
+            return splice_json(json_dumps({"occurrences": occurrences})[1:-1],
+                               self.document)
+        document = dict(self.document)
+        document["occurrences"] = occurrences
+        return document
+
+
+class Deduplicator(object):
+
+    """
+    Suppress repeats of an error for `window` seconds after it's first seen.
+
+    The first occurrence of a fingerprint should be reported as usual; any
+    repeats within the window only bump a counter. When the window closes,
+    if there were any repeats, `emit` is called with a copy of the first
+    document carrying an `occurrences` object: the `count` of repeats, the
+    `weight` they add up to (each repeat's sampling weight, or 1), and
+    `first_seen` and `last_seen` timestamps.
+
+    At most `maxsize` fingerprints are tracked; the least recently seen one is
+    closed early to make room for a new one. Windows are closed by a daemon
+    thread every `window / 4` seconds, and all of them are closed at exit.
+    """
+
+    def __init__(self, emit, window=60, maxsize=1000):
+        self.emit = emit
+        self.window = window
+        self._seen = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self._pid = None
+        atexit.register(self.flush)
+
+    def observe(self, fingerprint, document, now=None, weight=1):
+        """Record an occurrence, returning `True` if it was a suppressed repeat."""
+
+        if self._pid != os.getpid():
+            self._start()
+        if now is None:
+            now = time.time()
+
+        closed = []
+        self._lock.acquire()
+        try:
+            occurrence = self._seen.get(fingerprint)
+            if occurrence is not None:
+                if now - occurrence.first_seen < self.window:
+                    occurrence.add(now, weight)
+                    return True
+                closed.append(occurrence)
+
+            evicted = self._seen.put(fingerprint, Occurrence(document, now))
+            if evicted is not None:
+                closed.append(evicted[1])
+        finally:
+            self._lock.release()
+
+        self._close(closed)
+        return False
+
+    def repeat(self, fingerprint, now=None, weight=1):
+
+        """
+        Count an occurrence if it repeats one still in its window, returning
+        `True` if so.
+
+        This lets a repeat be suppressed before its document is even built;
+        anything else should be built and passed to `observe()`.
+        """
+
+        if now is None:
+            now = time.time()
+
+        self._lock.acquire()
+        try:
+            occurrence = self._seen.get(fingerprint)
+            if occurrence is None or now - occurrence.first_seen >= self.window:
+                return False
+            occurrence.add(now, weight)
+            return True
+        finally:
+            self._lock.release()
+
+    def expire(self, now=None):
+        """Close every window which has run its course."""
+
+        if now is None:
+            now = time.time()
+
+        closed = []
+        self._lock.acquire()
+        try:
+            for fingerprint, occurrence in self._seen.items():
+                if now - occurrence.first_seen >= self.window:
+                    self._seen.pop(fingerprint)
+                    closed.append(occurrence)
+        finally:
+            self._lock.release()
+
+        self._close(closed)
+
+    def flush(self):
+        """Close every window, whether or not it has run its course."""
+
+        self._lock.acquire()
+        try:
+            closed = [occurrence for fingerprint, occurrence in self._seen.items()]
+            self._seen.clear()
+        finally:
+            self._lock.release()
+
+        self._close(closed)
+
+    def _close(self, occurrences):
+        for occurrence in occurrences:
+            if occurrence.count:
+                try:
+                    self.emit(occurrence.aggregate())
+                except Exception, exc:
+                    LOG.exception("Error reporting repeated errors: %r", exc)
+
+    def _start(self):
+        self._lock.acquire()
+        try:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked; the parent will report the errors it has seen.
+                self._seen.clear()
+            self._pid = os.getpid()
+            sweeper = threading.Thread(target=self._sweep,
+                                       name='djexceptional-dedup')
+            sweeper.setDaemon(True)
+            sweeper.start()
+        finally:
+            self._lock.release()
+
+    def _sweep(self):
+        while True:
+            time.sleep(self.window / 4.0)
+            self.expire()
+
+
+def _isoformat(timestamp):
+    return datetime.datetime.utcfromtimestamp(timestamp).isoformat() + 'Z'
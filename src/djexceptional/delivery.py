@@ -0,0 +1,298 @@
+"""Strategies for getting error reports from the request thread to the API."""
+
+import atexit
+import errno
+import logging
+import os
+import Queue
+import socket
+import threading
+import time
+
+
+LOG = logging.getLogger('djexceptional')
+
+DROP_NEWEST = 'drop-newest'
+DROP_OLDEST = 'drop-oldest'
+
+# Put on the queue (once per worker) to tell the workers to exit.
+_STOP = object()
+
+
+class SyncDelivery(object):
+
+    """
+    Deliver each report immediately, in the calling thread.
+
+    Handlers are always called with a list of documents; here it's a list of
+    one.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def submit(self, document):
+        self.handler([document])
+
+    def close(self, timeout=None):
+        pass
+
+
+class QueuedDelivery(object):
+
+    """
+    Deliver reports from a pool of daemon worker threads.
+
+    `submit()` never blocks: documents are put on a bounded queue, and when
+    the queue is full either the new document (`'drop-newest'`) or the oldest
+    queued one (`'drop-oldest'`) is discarded. Workers are started lazily, and
+    again after a fork, so it's safe to create one in a pre-forking server's
+    master process. Anything still queued at interpreter shutdown is flushed,
+    waiting at most `shutdown_timeout` seconds.
+
+    Each worker collects documents into batches, calling `handler` with a list
+    once it holds `batch_size` documents or `batch_interval` seconds have
+    passed since the first one arrived, whichever comes first. The default
+    `batch_size` of 1 sends every document on its own.
+
+    Discarded documents are counted in `dropped`, and `on_drop()` (if given)
+    is called for each.
+    """
+
+    def __init__(self, handler, maxsize=100, overflow=DROP_NEWEST, workers=1,
+                 shutdown_timeout=5, batch_size=1, batch_interval=1.0, on_drop=None):
+        if overflow not in (DROP_NEWEST, DROP_OLDEST):
+            raise ValueError("Unknown overflow policy: %r" % (overflow,))
+
+        self.handler = handler
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.num_workers = workers
+        self.shutdown_timeout = shutdown_timeout
+        self.batch_size = max(1, batch_size)
+        self.batch_interval = batch_interval
+        self.on_drop = on_drop
+        self.dropped = 0
+
+        self.queue = Queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._workers = []
+        self._pid = None
+        atexit.register(self.close, shutdown_timeout)
+
+    def submit(self, document):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(document)
+        except Queue.Full:
+            self._overflow(document)
+
+    def _overflow(self, document):
+        self._lock.acquire()
+        try:
+            self.dropped += 1
+        finally:
+            self._lock.release()
+        if self.on_drop is not None:
+            self.on_drop()
+
+        if self.overflow == DROP_OLDEST:
+            try:
+                self.queue.get_nowait()
+            except Queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(document)
+            except Queue.Full:
+                # Another producer took the free slot; drop this one instead.
+                pass
+
+    def _start(self):
+        self._lock.acquire()
+        try:
+            pid = os.getpid()
+            if self._pid == pid:
+                return
+            if self._pid is not None:
+                # We're in a forked child; the parent's workers (and anything
+                # it had queued) didn't come with us.
+                self.queue = Queue.Queue(self.maxsize)
+            self._pid = pid
+            self._workers = []
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._run,
+                                          name='djexceptional-delivery-%d' % i)
+                worker.setDaemon(True)
+                worker.start()
+                self._workers.append(worker)
+        finally:
+            self._lock.release()
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            try:
+                document = self.queue.get(True, _remaining(deadline))
+            except Queue.Empty:
+                # The batch interval ran out before the batch filled up.
+                self._deliver(batch)
+                batch, deadline = [], None
+                continue
+
+            if document is _STOP:
+                if batch:
+                    self._deliver(batch)
+                return
+
+            if not batch:
+                deadline = time.time() + self.batch_interval
+            batch.append(document)
+            if len(batch) >= self.batch_size:
+                self._deliver(batch)
+                batch, deadline = [], None
+
+    def _deliver(self, batch):
+        try:
+            self.handler(batch)
+        except Exception, exc:
+            LOG.exception("Error delivering report to Exceptional: %r", exc)
+
+    def close(self, timeout=None):
+        """Stop the workers once everything queued so far has been delivered."""
+
+        self._lock.acquire()
+        try:
+            if self._pid != os.getpid():
+                return
+            workers, self._workers = self._workers, []
+            self._pid = None
+        finally:
+            self._lock.release()
+
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        for worker in workers:
+            try:
+                self.queue.put(_STOP, True, _remaining(deadline))
+            except Queue.Full:
+                break
+        for worker in workers:
+            worker.join(_remaining(deadline))
+
+
+class RelayDelivery(object):
+
+    """
+    Hand each report to a relay daemon on the same host.
+
+    `encode` turns a document into a message, which is written to the relay's
+    Unix datagram socket at `path` in a single non-blocking `sendto()`; the
+    relay (see `djexceptional.relay`) does the rest. If the relay's socket
+    buffer is full the report is dropped, as it would be by a full queue. If
+    the message can't be sent at all (the relay isn't running, or the message
+    is bigger than `max_message`), the document is handed to a fallback
+    delivery instead: the one `fallback()` returns, created the first time
+    it's needed, or by default a `QueuedDelivery` calling `handler`. Either
+    way, the calling thread never waits on the network.
+
+    `on_drop()` (if given) is called for each report dropped here, and passed
+    on to the default fallback.
+    """
+
+    def __init__(self, handler, path, encode, buffer_size=1024 * 1024,
+                 max_message=1024 * 1024, fallback=None, on_drop=None):
+        self.handler = handler
+        self.path = path
+        self.encode = encode
+        self.buffer_size = buffer_size
+        self.max_message = max_message
+        self.fallback = fallback or (lambda: QueuedDelivery(handler, on_drop=on_drop))
+        self.on_drop = on_drop
+        self.relaying = True
+
+        self._lock = threading.Lock()
+        self._socket = None
+        self._pid = None
+        self._dropped = 0
+        self._fallback = None
+
+    @property
+    def dropped(self):
+        return self._dropped + getattr(self._fallback, 'dropped', 0)
+
+    def submit(self, document):
+        try:
+            message = self.encode(document)
+        except Exception, exc:
+            LOG.exception("Error encoding report for the Exceptional relay: %r", exc)
+            return
+        if len(message) > self.max_message:
+            self._get_fallback().submit(document)
+            return
+        try:
+            self._get_socket().sendto(message, self.path)
+        except socket.error, exc:
+            if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                self._lock.acquire()
+                try:
+                    self._dropped += 1
+                finally:
+                    self._lock.release()
+                if self.on_drop is not None:
+                    self.on_drop()
+                return
+            if self.relaying:
+                LOG.warning("Couldn't write to the Exceptional relay at %s (%s); "
+                            "sending errors directly", self.path, exc)
+                self.relaying = False
+            self._get_fallback().submit(document)
+            return
+        self.relaying = True
+
+    def _get_fallback(self):
+        if self._fallback is None:
+            self._lock.acquire()
+            try:
+                if self._fallback is None:
+                    self._fallback = self.fallback()
+            finally:
+                self._lock.release()
+        return self._fallback
+
+    def _get_socket(self):
+        self._lock.acquire()
+        try:
+            if self._pid != os.getpid():
+                # Don't share a socket with our parent process.
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.buffer_size)
+                except socket.error:
+                    pass
+                sock.setblocking(0)
+                self._socket, self._pid = sock, os.getpid()
+            return self._socket
+        finally:
+            self._lock.release()
+
+    def close(self, timeout=None):
+        self._lock.acquire()
+        try:
+            if self._socket is not None and self._pid == os.getpid():
+                self._socket.close()
+            self._socket = self._pid = None
+            fallback = self._fallback
+        finally:
+            self._lock.release()
+        if fallback is not None:
+            fallback.close(timeout)
+
+
+def _remaining(deadline):
+    if deadline is None:
+        return None
+    return max(0, deadline - time.time())
@@ -0,0 +1,120 @@
+"""A `logging` handler which reports logged exceptions to Exceptional."""
+
+import copy
+import logging
+import threading
+
+from djexceptional import hooks
+from djexceptional.delivery import QueuedDelivery
+from djexceptional.throttle import TokenBucket
+from djexceptional.utils import Counters
+
+
+class ExceptionalHandler(logging.Handler):
+
+    """
+    Report log records which carry exception info, such as those from
+    `log.exception()` or `log.error(..., exc_info=True)`.
+
+    `emit()` checks the per-logger rate cap, formats the message, and puts
+    the record on a queue of `queue_size`, dropping it if that's full; a
+    worker thread builds the report (with the logger, level, message and
+    source location as its `context`) and hands it to `reporter` (by default
+    the process's shared one; see `djexceptional.hooks`) to be sampled,
+    deduplicated and delivered like any other. Each queued record keeps its
+    traceback's frames (and their locals) alive, so the queue is kept short.
+
+    Each logger may report at most `rate` records per second, in bursts of up
+    to `burst`; `None` means no cap. Records without exception info, and
+    records from `djexceptional`'s own logger, are ignored. `stats()` counts
+    the records `dropped` for a full queue and `rate_limited` by the cap.
+
+        import logging
+        from djexceptional.handlers import ExceptionalHandler
+        logging.getLogger().addHandler(ExceptionalHandler(rate=1, burst=10))
+    """
+
+    def __init__(self, level=logging.ERROR, rate=None, burst=None, queue_size=100,
+                 reporter=None):
+        logging.Handler.__init__(self, level)
+        self.rate = rate
+        self.burst = burst
+        self.reporter = reporter
+        self.counters = Counters()
+        self.queue = QueuedDelivery(self.report, maxsize=queue_size)
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+
+    def emit(self, record):
+        try:
+            if not record.exc_info or record.exc_info[1] is None:
+                return
+            if record.name == 'djexceptional' or record.name.startswith('djexceptional.'):
+                # Don't report our own failures to report.
+                return
+            if self.rate is not None and not self._bucket(record.name).consume():
+                self.counters.incr('rate_limited')
+                return
+
+            # Format the message now, so that changes to its arguments after
+            # this don't affect the report, and we don't hold on to them. The
+            # record is shared with the logger's other handlers, so we change
+            # (and queue) a copy.
+            queued = copy.copy(record)
+            queued.msg = self.record_message(record)
+            queued.args = None
+            self.queue.submit(queued)
+        except Exception:
+            self.handleError(record)
+
+    def stats(self):
+        stats = {'dropped': self.queue.dropped, 'rate_limited': 0}
+        stats.update(self.counters.snapshot())
+        return stats
+
+    def _bucket(self, name):
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            self._buckets_lock.acquire()
+            try:
+                bucket = self._buckets.get(name)
+                if bucket is None:
+                    bucket = self._buckets[name] = TokenBucket(self.rate, self.burst)
+            finally:
+                self._buckets_lock.release()
+        return bucket
+
+    def report(self, records):
+        """Report a batch of queued records (this runs on the worker)."""
+
+        reporter = self.reporter or hooks.get_reporter()
+        if reporter is None:
+            return
+        for record in records:
+            exc_type, exc_value, tb = record.exc_info
+            reporter.process(exc_value, tb, context=self.record_context(record))
+
+    @staticmethod
+    def record_message(record):
+        try:
+            return record.getMessage()
+        except Exception:
+            return repr(record.msg)
+
+    def record_context(self, record):
+        return {
+            "logger": record.name,
+            "level": record.levelname,
+            "message": self.record_message(record),
+            "pathname": record.pathname,
+            "lineno": record.lineno,
+            "function": getattr(record, 'funcName', None),
+            "thread": record.threadName,
+            "process": record.process,
+        }
+
+    def close(self):
+        """Hand everything queued so far to the reporter."""
+
+        self.queue.close(self.queue.shutdown_timeout)
+        logging.Handler.close(self)
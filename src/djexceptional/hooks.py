@@ -0,0 +1,152 @@
+"""
+Report errors which happen outside of a request.
+
+    from djexceptional import hooks
+
+    hooks.install_excepthook()          # Uncaught exceptions, e.g. in a script.
+
+    @hooks.report_errors(context={'task': 'nightly-import'})
+    def nightly_import():
+        ...
+
+    with hooks.report_errors(reraise=False):
+        ...
+
+    try:
+        ...
+    except Exception:
+        hooks.report(context={'user_id': user.id})
+
+All of these go through one `Reporter` per process, shared with the first
+`ExceptionalMiddleware` if there is one, so they use the same delivery (set
+`EXCEPTIONAL_DELIVERY = 'queue'` or `'relay'` so a job raising thousands of
+errors isn't held up sending them). Like the middleware, they do nothing
+while `DEBUG` is on.
+"""
+
+import logging
+import sys
+import threading
+
+
+LOG = logging.getLogger('djexceptional')
+
+_reporter = None
+_lock = threading.Lock()
+
+
+def get_reporter():
+
+    """
+    Return the process's shared `Reporter`, creating it if need be.
+
+    Returns `None` while `DEBUG` is on.
+    """
+
+    global _reporter
+
+    from django.conf import settings
+    if settings.DEBUG:
+        return None
+    if _reporter is None:
+        # Imported here, since `djexceptional` imports this module.
+        from djexceptional import Reporter
+        _lock.acquire()
+        try:
+            if _reporter is None:
+                _reporter = Reporter()
+        finally:
+            _lock.release()
+    return _reporter
+
+
+def set_default_reporter(reporter, replace=True):
+    """Make `reporter` the shared one (unless there is one, and not `replace`)."""
+
+    global _reporter
+
+    _lock.acquire()
+    try:
+        if replace or _reporter is None:
+            _reporter = reporter
+    finally:
+        _lock.release()
+
+
+def report(exc_info=None, context=None):
+
+    """
+    Report an exception: by default, the one currently being handled.
+
+    Never raises; a failure to report is logged instead.
+    """
+
+    if exc_info is None:
+        exc_info = sys.exc_info()
+    try:
+        reporter = get_reporter()
+        if reporter is not None:
+            reporter.report(exc_info, context)
+    except Exception, exc:
+        LOG.exception("Error reporting to Exceptional: %r", exc)
+
+
+class report_errors(object):
+
+    """
+    Report exceptions raised in a function (as a decorator) or a block (as a
+    context manager), with an optional `context` dictionary.
+
+    The exception carries on propagating unless `reraise` is false.
+    `KeyboardInterrupt` and `SystemExit` are never reported.
+    """
+
+    def __init__(self, context=None, reraise=True):
+        self.context = context
+        self.reraise = reraise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None or issubclass(exc_type, (KeyboardInterrupt, SystemExit)):
+            return False
+        report((exc_type, exc_value, tb), self.context)
+        return not self.reraise
+
+    def __call__(self, func):
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                exc_info = sys.exc_info()
+                report(exc_info, self.context)
+                if self.reraise:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        if hasattr(func, '__module__'):
+            wrapper.__module__ = func.__module__
+        return wrapper
+
+
+def install_excepthook():
+
+    """
+    Report uncaught exceptions, before handing them on to the current
+    `sys.excepthook`.
+
+    Anything queued is still sent as the interpreter exits, within
+    `EXCEPTIONAL_SHUTDOWN_TIMEOUT`.
+    """
+
+    previous = sys.excepthook
+    def excepthook(exc_type, exc_value, tb):
+        if not issubclass(exc_type, KeyboardInterrupt):
+            report((exc_type, exc_value, tb))
+        previous(exc_type, exc_value, tb)
+    sys.excepthook = excepthook
+    return excepthook
@@ -0,0 +1,53 @@
+import signal
+from optparse import make_option
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management.base import CommandError, NoArgsCommand
+
+import djexceptional
+from djexceptional import ExceptionalMiddleware
+from djexceptional.relay import RelayServer
+
+
+class Command(NoArgsCommand):
+
+    help = ("Send the error reports of every process on this host which has "
+            "EXCEPTIONAL_DELIVERY = 'relay'.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--socket', dest='socket', default=None,
+                    help="The socket to listen on (default: EXCEPTIONAL_RELAY_SOCKET)."),
+    )
+
+    def handle_noargs(self, **options):
+        path = options['socket'] or djexceptional.EXCEPTIONAL_RELAY_SOCKET
+        try:
+            # The relay's own reports go through a queue, with whatever
+            # batching, deduplication, compression and spooling are set up.
+            middleware = ExceptionalMiddleware(delivery='queue')
+        except MiddlewareNotUsed:
+            raise CommandError("Exceptional reporting is off while DEBUG is on.")
+
+        server = RelayServer(path, middleware.submit)
+        signal.signal(signal.SIGTERM, _exit)
+        try:
+            try:
+                server.serve_forever()
+            except (KeyboardInterrupt, SystemExit):
+                pass
+        finally:
+            server.close()
+            if middleware.deduplicator is not None:
+                middleware.deduplicator.flush()
+            middleware.delivery.close(djexceptional.EXCEPTIONAL_SHUTDOWN_TIMEOUT)
+
+        if int(options.get('verbosity', 1)) >= 1:
+            stats = middleware.stats()
+            stats['received'] = server.received
+            self.stdout.write("Relayed %(received)d errors: %(sent)d sent, "
+                              "%(deduplicated)d deduplicated, %(dropped)d dropped, "
+                              "%(failed)d failed, %(spooled)d spooled.\n" % stats)
+
+
+def _exit(signum, frame):
+    raise SystemExit
@@ -0,0 +1,45 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import CommandError, NoArgsCommand
+
+import djexceptional
+from djexceptional.spool import Spool, replay
+
+
+class Command(NoArgsCommand):
+
+    help = "Send the error reports saved in EXCEPTIONAL_SPOOL_DIR to Exceptional."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--directory', dest='directory', default=None,
+                    help="The spool directory (default: EXCEPTIONAL_SPOOL_DIR)."),
+        make_option('--workers', dest='workers', type='int', default=4,
+                    help="How many payloads to send at once (default: 4)."),
+    )
+
+    def handle_noargs(self, **options):
+        directory = options['directory'] or djexceptional.EXCEPTIONAL_SPOOL_DIR
+        if directory is None:
+            raise CommandError("No spool directory; set EXCEPTIONAL_SPOOL_DIR "
+                               "or pass --directory.")
+        try:
+            api_key = settings.EXCEPTIONAL_API_KEY
+        except AttributeError:
+            raise CommandError("You need to add an EXCEPTIONAL_API_KEY setting.")
+
+        url = djexceptional.api_endpoint(api_key)
+        transport = djexceptional.get_transport()
+        # Payloads which fail again go into new segments, for the next run.
+        spool = Spool(directory)
+        try:
+            results = replay(directory,
+                             lambda payload, headers: transport.post(url, payload, headers),
+                             workers=options['workers'], spool=spool)
+        finally:
+            spool.close()
+            transport.close()
+
+        if int(options.get('verbosity', 1)) >= 1:
+            self.stdout.write("Sent %(sent)d errors; %(rejected)d rejected, "
+                              "%(failed)d failed.\n" % results)
@@ -0,0 +1,194 @@
+"""
+Measure what reporting errors costs, stage by stage.
+
+A reporter with a metrics sink records, for each report:
+
+    build        Time to build the error document.            (timing)
+    serialize    Time to encode it as JSON.                   (timing)
+    compress     Time to compress the request body.           (timing)
+    enqueue      Time to hand it to the delivery.             (timing)
+    send         Time to POST it.                             (timing)
+    bytes.raw         Size of each serialized document.       (histogram)
+    bytes.compressed  Size of each request body.              (histogram)
+    sent, failed, suppressed, spooled, dropped, sampled_out,
+    deduplicated      Errors, as in `Reporter.stats()`.       (counters)
+
+Timings are in seconds. With synchronous delivery `enqueue` includes sending;
+with streaming, `serialize` and `compress` happen during `send`, and aren't
+recorded separately.
+
+Without a sink (the default) all of this is skipped after a single check.
+"""
+
+import collections
+import errno
+import logging
+import socket
+import threading
+
+
+LOG = logging.getLogger('djexceptional.metrics')
+
+
+class Histogram(object):
+
+    """
+    Summarise a stream of values: their count, total, minimum and maximum
+    over all time, and percentiles of the most recent `size`.
+    """
+
+    def __init__(self, size=1000):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.recent = collections.deque(maxlen=size)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.recent.append(value)
+
+    def summary(self):
+        values = sorted(self.recent)
+        summary = {'count': self.count, 'total': self.total,
+                   'min': self.min, 'max': self.max}
+        for percentile in (50, 95, 99):
+            if values:
+                index = min(len(values) - 1, len(values) * percentile // 100)
+                summary['p%d' % percentile] = values[index]
+            else:
+                summary['p%d' % percentile] = None
+        return summary
+
+
+class MemoryMetrics(object):
+
+    """Keep counters and histograms in memory, for `snapshot()` to return."""
+
+    def __init__(self, size=1000):
+        self.size = size
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        self._lock.acquire()
+        try:
+            self._counters[name] = self._counters.get(name, 0) + amount
+        finally:
+            self._lock.release()
+
+    def histogram(self, name, value):
+        self._lock.acquire()
+        try:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(self.size)
+            histogram.add(value)
+        finally:
+            self._lock.release()
+
+    timing = histogram
+
+    def snapshot(self):
+
+        """
+        Return `{'counters': {name: count}, 'histograms': {name: summary}}`,
+        where each summary is a dictionary of `count`, `total`, `min`, `max`,
+        `p50`, `p95` and `p99`.
+        """
+
+        self._lock.acquire()
+        try:
+            return {
+                'counters': dict(self._counters),
+                'histograms': dict((name, histogram.summary())
+                                   for name, histogram in self._histograms.items()),
+            }
+        finally:
+            self._lock.release()
+
+
+class StatsdMetrics(object):
+
+    """
+    Send metrics to a StatsD daemon over UDP, one datagram per metric.
+
+    Timings are sent in milliseconds. Sends never block, and metrics which
+    can't be sent are dropped.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='djexceptional'):
+        self.address = (host, port)
+        self.prefix = prefix and prefix + '.' or ''
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def incr(self, name, amount=1):
+        self._send('%s%s:%d|c' % (self.prefix, name, amount))
+
+    def histogram(self, name, value):
+        self._send('%s%s:%d|h' % (self.prefix, name, value))
+
+    def timing(self, name, seconds):
+        self._send('%s%s:%.3f|ms' % (self.prefix, name, seconds * 1000))
+
+    def _send(self, line):
+        try:
+            self.socket.sendto(line, self.address)
+        except socket.error, exc:
+            if exc.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS,
+                                   errno.ECONNREFUSED):
+                LOG.warning("Couldn't send metrics to StatsD at %s:%d: %r",
+                            self.address[0], self.address[1], exc)
+
+    def close(self):
+        self.socket.close()
+
+
+class LogMetrics(object):
+
+    """Log each metric as a line, e.g. `timing send=0.012345`."""
+
+    def __init__(self, logger=LOG, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+
+    def incr(self, name, amount=1):
+        self.logger.log(self.level, "counter %s=%d", name, amount)
+
+    def histogram(self, name, value):
+        self.logger.log(self.level, "histogram %s=%d", name, value)
+
+    def timing(self, name, seconds):
+        self.logger.log(self.level, "timing %s=%.6f", name, seconds)
+
+
+SINKS = {
+    'memory': MemoryMetrics,
+    'statsd': StatsdMetrics,
+    'log': LogMetrics,
+}
+
+
+def get_metrics(name, options=None):
+
+    """
+    Look up a metrics sink by name (`'memory'`, `'statsd'` or `'log'`), and
+    instantiate it with the keyword arguments in `options`.
+
+    `None` means no sink, and returns `None`.
+    """
+
+    if name is None:
+        return None
+    try:
+        sink_class = SINKS[name]
+    except KeyError:
+        raise ValueError("Unknown metrics sink: %r" % (name,))
+    return sink_class(**(options or {}))
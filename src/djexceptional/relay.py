@@ -0,0 +1,122 @@
+"""A per-host daemon which sends the reports of every process on the host."""
+
+import errno
+import logging
+import os
+import socket
+import stat
+
+
+LOG = logging.getLogger('djexceptional')
+
+MSG_TRUNC = getattr(socket, 'MSG_TRUNC', 0)
+
+# The most we'll read of any one message. That's comfortably more than a
+# report within the default EXCEPTIONAL_PAYLOAD_LIMITS; processes don't send
+# the relay anything bigger.
+MAX_MESSAGE = 1024 * 1024
+
+
+def relay_message(fingerprint, document_json, weight=1):
+
+    """
+    Build the message a process sends the relay for one error.
+
+    It's the error's fingerprint and, if it isn't 1, its sampling weight, so
+    the relay can deduplicate without decoding anything; then a newline, then
+    the document as JSON.
+    """
+
+    if weight != 1:
+        fingerprint = '%s %r' % (fingerprint, float(weight))
+    return fingerprint + '\n' + document_json
+
+
+def parse_message(message):
+    """Split a relay message into its fingerprint, JSON document and weight."""
+
+    header, newline, document_json = message.partition('\n')
+    if not newline or not document_json.startswith('{'):
+        raise ValueError("Malformed relay message")
+    fingerprint, space, weight = header.partition(' ')
+    if space:
+        return fingerprint, document_json, float(weight)
+    return fingerprint, document_json, 1
+
+
+class RelayServer(object):
+
+    """
+    Receive relay messages on a Unix datagram socket at `path`.
+
+    Each document is passed to `submit(document_json, fingerprint, weight)`; that's
+    usually `ExceptionalMiddleware.submit`, so the relay deduplicates, queues,
+    batches, compresses and sends reports just as a process would on its own.
+    Documents stay encoded throughout; the middleware's `serialize()` passes
+    them through as they are.
+    """
+
+    def __init__(self, path, submit, buffer_size=4 * 1024 * 1024):
+        self.path = path
+        self.submit = submit
+        self.received = 0
+        self.malformed = 0
+        # Every message is read into this, so that reading one only allocates
+        # as much as it holds.
+        self._buffer = bytearray(MAX_MESSAGE)
+
+        self._unlink_stale()
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+        except socket.error:
+            pass
+        self.socket.bind(path)
+
+    def _unlink_stale(self):
+        try:
+            if stat.S_ISSOCK(os.stat(self.path).st_mode):
+                os.unlink(self.path)
+        except OSError, exc:
+            if exc.errno != errno.ENOENT:
+                raise
+
+    def serve_forever(self):
+        while True:
+            self.handle_one()
+
+    def handle_one(self):
+        try:
+            # With MSG_TRUNC (on Linux), a longer message's full length is
+            # returned, so we can tell it was cut short.
+            length = self.socket.recv_into(self._buffer, 0, MSG_TRUNC)
+        except socket.error, exc:
+            if exc.args[0] == errno.EINTR:
+                return
+            raise
+        if length > len(self._buffer):
+            self.malformed += 1
+            LOG.warning("Ignoring a %d-byte message to the Exceptional relay", length)
+            return
+        self.handle(memoryview(self._buffer)[:length].tobytes())
+
+    def handle(self, message):
+        try:
+            fingerprint, document_json, weight = parse_message(message)
+        except ValueError:
+            self.malformed += 1
+            LOG.warning("Ignoring a malformed message to the Exceptional relay")
+            return
+
+        self.received += 1
+        try:
+            self.submit(document_json, fingerprint, weight)
+        except Exception, exc:
+            LOG.exception("Error relaying report to Exceptional: %r", exc)
+
+    def close(self):
+        self.socket.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,75 @@
+"""Report a representative sample of errors, rather than every one."""
+
+import random
+import threading
+import time
+
+from djexceptional.utils import LRUCache
+
+
+class Sampler(object):
+
+    """
+    Decide which errors to report, and how many each report stands for.
+
+    Each error is kept with a probability of `rate`, or of
+    `class_rates[exception_class]` if its class is listed there. With a
+    `target`, sampling is also adaptive: once an error's fingerprint has been
+    seen more than `target` times in the current `window` seconds, the
+    probability is scaled down by `target / count`, so each fingerprint sends
+    roughly `target` reports per window however often it happens. At most
+    `maxsize` fingerprints are tracked.
+
+    `sample()` returns the weight of a kept error (the inverse of the
+    probability it was kept with), so the sum of the weights estimates the
+    true number of errors; or `None` if it should be dropped.
+    """
+
+    def __init__(self, rate=1.0, class_rates=None, target=None, window=60,
+                 maxsize=1000, random=random.random):
+        self.rate = float(rate)
+        self.class_rates = dict(class_rates or {})
+        self.target = target
+        self.window = window
+        self.random = random
+        self._counts = LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    @property
+    def adaptive(self):
+        """Whether `sample()` needs fingerprints."""
+
+        return self.target is not None
+
+    def probability(self, exception_class, fingerprint=None, now=None):
+        """Return the probability with which to keep an error, and count it."""
+
+        probability = self.class_rates.get(exception_class, self.rate)
+        if self.target is not None and fingerprint is not None:
+            count = self._count(fingerprint, now)
+            if count > self.target:
+                probability *= float(self.target) / count
+        return probability
+
+    def sample(self, exception_class, fingerprint=None, now=None):
+        probability = self.probability(exception_class, fingerprint, now)
+        if probability >= 1:
+            return 1
+        if probability <= 0 or self.random() >= probability:
+            return None
+        return 1 / probability
+
+    def _count(self, fingerprint, now):
+        if now is None:
+            now = time.time()
+
+        self._lock.acquire()
+        try:
+            counter = self._counts.get(fingerprint)
+            if counter is None or now - counter[0] >= self.window:
+                counter = [now, 0]
+                self._counts.put(fingerprint, counter)
+            counter[1] += 1
+            return counter[1]
+        finally:
+            self._lock.release()
@@ -0,0 +1,80 @@
+"""Mask sensitive values throughout an error document."""
+
+import re
+import threading
+
+
+# Regular expressions, matched case-insensitively anywhere in a key.
+DEFAULT_PATTERNS = (
+    r'password',
+    r'passwd',
+    r'secret',
+    r'token',
+    r'api[-_]?key',
+    r'authorization',
+    r'cookie',
+    r'session[-_]?id',
+    r'credit[-_]?card',
+    r'card[-_]?number',
+    r'cvv',
+)
+
+FILTERED = '[FILTERED]'
+
+
+class Scrubber(object):
+
+    """
+    Replace the values of sensitive-looking keys, at any depth, with a mask.
+
+    All the patterns are compiled into one regular expression up front, and
+    the verdict for each key is remembered (for up to `max_keys` distinct
+    keys), so scrubbing is a single walk over the data which costs one
+    dictionary lookup per key.
+    """
+
+    def __init__(self, patterns=DEFAULT_PATTERNS, mask=FILTERED, max_keys=10000):
+        self.patterns = tuple(patterns)
+        self.mask = mask
+        self.max_keys = max_keys
+        self._regex = None
+        if self.patterns:
+            self._regex = re.compile('|'.join('(?:%s)' % pattern
+                                              for pattern in self.patterns),
+                                     re.IGNORECASE)
+        self._verdicts = {}
+        self._lock = threading.Lock()
+
+    def is_sensitive(self, key):
+        try:
+            return self._verdicts[key]
+        except (KeyError, TypeError):
+            pass
+
+        sensitive = (self._regex is not None and isinstance(key, basestring)
+                     and self._regex.search(key) is not None)
+        self._lock.acquire()
+        try:
+            if len(self._verdicts) < self.max_keys:
+                try:
+                    self._verdicts[key] = sensitive
+                except TypeError:
+                    pass
+        finally:
+            self._lock.release()
+        return sensitive
+
+    def scrub(self, value):
+        """Return a copy of `value` with the sensitive entries masked."""
+
+        if isinstance(value, dict):
+            scrubbed = {}
+            for key, item in value.iteritems():
+                if self.is_sensitive(key):
+                    scrubbed[key] = self.mask
+                else:
+                    scrubbed[key] = self.scrub(item)
+            return scrubbed
+        elif isinstance(value, (list, tuple)):
+            return [self.scrub(item) for item in value]
+        return value
@@ -0,0 +1,128 @@
+"""Backends for encoding error documents as JSON."""
+
+import datetime
+import decimal
+
+from djexceptional.utils import ResilientJSONEncoder, json_dumps, json_iterencode
+
+
+class ResilientSerializer(object):
+
+    """Encode with `ResilientJSONEncoder`, via `django.utils.simplejson`."""
+
+    name = 'resilient'
+
+    def dumps(self, obj):
+        return json_dumps(obj)
+
+    def iterencode(self, obj):
+        return json_iterencode(obj)
+
+
+class FastSerializer(ResilientSerializer):
+
+    """
+    Encode with the fastest JSON library available.
+
+    That's `simplejson` if it has its C speedups, or the standard library's
+    `json` if *it* does. Dates, times and decimals are formatted as the
+    resilient encoder would, but without the `isinstance()` chain and
+    `strftime()`; anything else JSON can't represent is handed to
+    `ResilientJSONEncoder.default()`. The encoder also skips the circular
+    reference checks. If it fails for any reason, the document is encoded
+    again by the resilient encoder.
+
+    Streaming (`iterencode()`) always uses the resilient encoder, since the
+    C encoders can only produce their output in one piece.
+    """
+
+    name = 'fast'
+
+    def __init__(self):
+        self.library, options = _fast_library()
+        self.encoder = None
+        if self.library is not None:
+            self.encoder = self.library.JSONEncoder(
+                check_circular=False, default=fast_default, **options)
+
+    def dumps(self, obj):
+        if self.encoder is not None:
+            try:
+                return self.encoder.encode(obj)
+            except Exception:
+                pass
+        return json_dumps(obj)
+
+
+def _format_datetime(o):
+    if o.year < 1000:
+        return _resilient_default(o)
+    return '%04d-%02d-%02d %02d:%02d:%02d' % (
+        o.year, o.month, o.day, o.hour, o.minute, o.second)
+
+
+def _format_date(o):
+    if o.year < 1000:
+        return _resilient_default(o)
+    return '%04d-%02d-%02d' % (o.year, o.month, o.day)
+
+
+def _format_time(o):
+    return '%02d:%02d:%02d' % (o.hour, o.minute, o.second)
+
+
+_resilient_default = ResilientJSONEncoder().default
+
+# Keyed on the exact type, so subclasses go the long way round.
+_FORMATTERS = {
+    datetime.datetime: _format_datetime,
+    datetime.date: _format_date,
+    datetime.time: _format_time,
+    decimal.Decimal: str,
+}
+
+
+def fast_default(o):
+    """A quicker `ResilientJSONEncoder.default()` for the common cases."""
+
+    formatter = _FORMATTERS.get(type(o))
+    if formatter is None:
+        return _resilient_default(o)
+    return formatter(o)
+
+
+def _fast_library():
+    """Return the fastest available JSON module, and any options it needs."""
+
+    try:
+        import simplejson
+        if simplejson._import_c_make_encoder() is not None:
+            # Keep `Decimal`s as strings, as the resilient encoder does.
+            return simplejson, {'use_decimal': False}
+    except (ImportError, AttributeError):
+        pass
+
+    try:
+        import json
+        from json import encoder
+        if encoder.c_make_encoder is not None:
+            return json, {}
+    except (ImportError, AttributeError):
+        pass
+
+    return None, {}
+
+
+SERIALIZERS = {
+    'resilient': ResilientSerializer,
+    'fast': FastSerializer,
+}
+
+
+def get_serializer(name):
+    """Look up a serializer by name (`'fast'` or `'resilient'`)."""
+
+    try:
+        return SERIALIZERS[name]()
+    except KeyError:
+        raise ValueError("Unknown serializer: %r" % (name,))
@@ -0,0 +1,280 @@
+"""An on-disk spool for reports which couldn't be delivered, and its replay."""
+
+import errno
+import logging
+import os
+import Queue
+import struct
+import threading
+import time
+import zlib
+
+from django.utils import simplejson
+
+from djexceptional.transport import TransportError
+
+
+LOG = logging.getLogger('djexceptional')
+
+# Segments being written are `.part` files; complete ones are `.spool` files.
+PART_SUFFIX = '.part'
+SEGMENT_SUFFIX = '.spool'
+
+# Each record is a header (the lengths of its metadata and payload, and a
+# CRC-32 of both), then the metadata as JSON, then the payload.
+RECORD_HEADER = struct.Struct('>IIi')
+
+
+class Spool(object):
+
+    """
+    Append already-compressed payloads to segment files in `directory`.
+
+    Writes go straight to the file descriptor (so nothing is left in a buffer
+    to be duplicated by a fork), but are only `fsync()`ed once `sync_interval`
+    seconds have passed since the last sync, so a burst of failures costs one
+    sync rather than one each. A segment is closed, synced and renamed from
+    `.part` to `.spool` once it holds `segment_bytes` bytes or is
+    `segment_age` seconds old, and when the spool is closed.
+
+    Each process writes its own segments, named after the time they were
+    started and the process ID.
+    """
+
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024, segment_age=60,
+                 sync_interval=1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_age = segment_age
+        self.sync_interval = sync_interval
+
+        self._lock = threading.Lock()
+        self._fd = None
+        self._path = None
+        self._pid = None
+        self._size = 0
+        self._opened = 0
+        self._synced = 0
+        self._sequence = 0
+
+    def append(self, payload, headers, count=1):
+
+        """
+        Spool one payload, as it would have been POSTed.
+
+        `headers` are the codec's headers (so the payload can be sent as it
+        is) and `count` the number of errors it holds.
+        """
+
+        meta = simplejson.dumps({'headers': headers, 'count': count})
+        crc = zlib.crc32(payload, zlib.crc32(meta))
+        record = RECORD_HEADER.pack(len(meta), len(payload), crc) + meta + payload
+
+        self._lock.acquire()
+        try:
+            now = time.time()
+            if self._pid != os.getpid():
+                # Forked: the descriptor belongs to the parent's segment.
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._pid = os.getpid()
+            elif self._fd is not None and (self._size >= self.segment_bytes or
+                                           now - self._opened >= self.segment_age):
+                self._rotate()
+            if self._fd is None:
+                self._open(now)
+
+            _write_all(self._fd, record)
+            self._size += len(record)
+            if now - self._synced >= self.sync_interval:
+                os.fsync(self._fd)
+                self._synced = now
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """Sync and complete the current segment, if there is one."""
+
+        self._lock.acquire()
+        try:
+            if self._fd is not None and self._pid == os.getpid():
+                self._rotate()
+        finally:
+            self._lock.release()
+
+    def _open(self, now):
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError, exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+        self._sequence += 1
+        name = '%d-%d-%d' % (int(now * 1000), self._pid, self._sequence)
+        self._path = os.path.join(self.directory, name + PART_SUFFIX)
+        self._fd = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0600)
+        self._size = 0
+        self._opened = self._synced = now
+
+    def _rotate(self):
+        try:
+            os.fsync(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+        os.rename(self._path, self._path[:-len(PART_SUFFIX)] + SEGMENT_SUFFIX)
+
+
+def _write_all(fd, data):
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def read_segment(path):
+
+    """
+    Yield `(payload, headers, count)` for each record in a segment.
+
+    Reading stops at the first incomplete or corrupt record, as left behind
+    by a process which died mid-write.
+    """
+
+    fp = open(path, 'rb')
+    try:
+        while True:
+            header = fp.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            meta_length, payload_length, crc = RECORD_HEADER.unpack(header)
+            meta = fp.read(meta_length)
+            payload = fp.read(payload_length)
+            if (len(meta) < meta_length or len(payload) < payload_length or
+                    zlib.crc32(payload, zlib.crc32(meta)) != crc):
+                LOG.warning("Spool segment %s is truncated or corrupt; "
+                            "skipping the rest of it", path)
+                return
+            meta = simplejson.loads(meta)
+            headers = dict((str(name), str(value))
+                           for name, value in meta['headers'].items())
+            yield payload, headers, meta['count']
+    finally:
+        fp.close()
+
+
+def segments(directory):
+
+    """
+    List the segments in `directory` which are ready to be replayed, oldest first.
+
+    That's the complete ones, plus any left incomplete by a process which no
+    longer exists.
+    """
+
+    if not os.path.isdir(directory):
+        return []
+
+    paths = []
+    for name in os.listdir(directory):
+        if name.endswith(SEGMENT_SUFFIX):
+            paths.append(name)
+        elif name.endswith(PART_SUFFIX) and not _pid_alive(_segment_pid(name)):
+            paths.append(name)
+    paths.sort(key=lambda name: [int(part) for part in name.split('.')[0].split('-')])
+    return [os.path.join(directory, name) for name in paths]
+
+
+def _segment_pid(name):
+    try:
+        return int(name.split('.')[0].split('-')[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def _pid_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError, exc:
+        return exc.errno == errno.EPERM
+    return True
+
+
+def replay(directory, post, workers=4, spool=None):
+
+    """
+    Send every spooled payload with `post(payload, headers)`, then remove it.
+
+    Payloads are sent as they were spooled, by `workers` threads at once.
+    Those the endpoint rejects (a 4xx response) are dropped; those which fail
+    otherwise are appended to `spool` (if given) to be tried again later. If
+    every payload in a segment fails that way, the endpoint is taken to be
+    down, and the remaining segments are left alone.
+
+    Returns a dictionary counting the errors `sent`, `rejected` and `failed`.
+    """
+
+    results = {'sent': 0, 'rejected': 0, 'failed': 0}
+    for path in segments(directory):
+        records = list(read_segment(path))
+        failures = _replay_records(records, post, workers, results)
+        if records and len(failures) == len(records):
+            LOG.warning("Couldn't replay any of %s; stopping", path)
+            results['failed'] += sum(count for payload, headers, count in failures)
+            break
+
+        for payload, headers, count in failures:
+            results['failed'] += count
+            if spool is not None:
+                spool.append(payload, headers, count)
+        if spool is not None:
+            spool.close()
+        os.remove(path)
+    return results
+
+
+def _replay_records(records, post, workers, results):
+    pending = Queue.Queue()
+    for record in records:
+        pending.put(record)
+    failures = []
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            try:
+                payload, headers, count = pending.get_nowait()
+            except Queue.Empty:
+                return
+            outcome = 'sent'
+            try:
+                post(payload, headers)
+            except TransportError, exc:
+                if 400 <= exc.status < 500:
+                    LOG.warning("Exceptional endpoint rejected %d spooled errors "
+                                "(HTTP %d); dropping them", count, exc.status)
+                    outcome = 'rejected'
+                else:
+                    LOG.warning("Couldn't replay %d spooled errors: %r", count, exc)
+                    outcome = None
+            except Exception, exc:
+                LOG.warning("Couldn't replay %d spooled errors: %r", count, exc)
+                outcome = None
+
+            lock.acquire()
+            try:
+                if outcome is None:
+                    failures.append((payload, headers, count))
+                else:
+                    results[outcome] += count
+            finally:
+                lock.release()
+
+    threads = [threading.Thread(target=work) for i in range(max(1, workers))]
+    for thread in threads:
+        thread.setDaemon(True)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return failures
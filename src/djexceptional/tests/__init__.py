@@ -1 +1,21 @@
+from djexceptional.tests.backtrace import CaptureFramesTest, LazyBacktraceTest
+from djexceptional.tests.compression import CodecTest
+from djexceptional.tests.dedup import (DeduplicatingMiddlewareTest, DeduplicatorTest,
+                                       FingerprintTest)
+from djexceptional.tests.delivery import QueuedDeliveryTest
+from djexceptional.tests.handlers import ExceptionalHandlerTest
+from djexceptional.tests.headers import HeaderTranslatorTest
+from djexceptional.tests.hooks import HooksTest
+from djexceptional.tests.lru import LRUCacheTest
 from djexceptional.tests.memoize import MemoizeTest
+from djexceptional.tests.metrics import MetricsTest, ReporterMetricsTest
+from djexceptional.tests.middleware import (ResolveViewTest, SendTest, SerializeTest,
+                                            ViewNameTest)
+from djexceptional.tests.relay import RelayTest
+from djexceptional.tests.sampling import ErrorFingerprintTest, SamplerTest
+from djexceptional.tests.scrubbing import ScrubberTest
+from djexceptional.tests.serializers import SerializerTest
+from djexceptional.tests.spool import ReplayTest, SpoolTest, SpoolingMiddlewareTest
+from djexceptional.tests.throttle import CircuitBreakerTest, TokenBucketTest
+from djexceptional.tests.transport import HTTPTransportTest, QueuedMiddlewareTest
+from djexceptional.tests.truncation import TruncateTest
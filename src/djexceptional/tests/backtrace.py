@@ -0,0 +1,178 @@
+import sys
+import traceback
+
+from django.contrib.sessions.models import Session
+from django.test import TestCase
+from django.utils import simplejson
+
+from djexceptional.backtrace import LazyBacktrace, capture_frames, extract_frames
+from djexceptional.dedup import fingerprint
+from djexceptional.scrubbing import Scrubber
+from djexceptional.serializers import FastSerializer
+from djexceptional.utils import json_dumps
+
+
+def raise_nested():
+    def inner():
+        raise ValueError("Nested")
+    inner()
+
+
+def raise_with_locals():
+    password = 'hunter2'
+    items = range(100000)
+    text = 'x' * 1000
+    raise ValueError("Locals")
+
+
+def raise_with_nested_secrets():
+    data = {'password': 'hunter2', 'cards': [{'card_number': '4111'}], 'name': 'Bob'}
+    raise ValueError("Nested secrets")
+
+
+def capture_with_locals():
+    try:
+        raise_with_locals()
+    except ValueError:
+        return sys.exc_info()[2]
+
+
+def capture():
+    try:
+        raise_nested()
+    except ValueError:
+        return sys.exc_info()[2]
+
+
+class LazyBacktraceTest(TestCase):
+
+    def setUp(self):
+        tb = capture()
+        self.eager = []
+        for tb_part in traceback.format_tb(tb):
+            self.eager.extend(tb_part.rstrip().splitlines())
+        self.lazy = LazyBacktrace(extract_frames(tb))
+
+    def test_format(self):
+        """Test that the deferred formatting matches `traceback.format_tb()`."""
+
+        self.assertEqual(self.lazy.format(), self.eager)
+
+    def test_encoding(self):
+        """Test that both serializers format the backtrace as they encode it."""
+
+        document = {"backtrace": self.lazy}
+        self.assertEqual(simplejson.loads(json_dumps(document))["backtrace"], self.eager)
+        self.assertEqual(simplejson.loads(FastSerializer().dumps(document))["backtrace"],
+                         self.eager)
+
+    def test_limits(self):
+        lazy = LazyBacktrace(self.lazy.frames, {'items': 2, 'tail': True})
+        self.assertEqual(lazy.for_json(), ['...[%d more items]' % (len(self.eager) - 2)]
+                         + self.eager[-2:])
+
+    def test_fingerprint(self):
+        """Test that lazy and eager backtraces get the same fingerprint."""
+
+        self.assertEqual(fingerprint('ValueError', ('a', 'b'), self.lazy),
+                         fingerprint('ValueError', ('a', 'b'), self.eager))
+
+
+class CaptureFramesTest(TestCase):
+
+    def test_frames(self):
+        frames, truncated = capture_frames(capture_with_locals(), scrubber=Scrubber())
+        self.assertEqual(truncated, None)
+        self.assertEqual([frame["function"] for frame in frames],
+                         ['capture_with_locals', 'raise_with_locals'])
+
+        inner = frames[-1]
+        self.assertEqual(inner["filename"], raise_with_locals.func_code.co_filename)
+        self.assertEqual(inner["context"]["line"].strip(), 'raise ValueError("Locals")')
+        self.assertEqual(len(inner["context"]["pre"]), 3)
+        self.assertEqual(inner["locals"]["password"], '[FILTERED]')
+        self.assertEqual(inner["locals"]["items"][:3], '[0,')
+        self.assertTrue(len(inner["locals"]["items"]) < 50)
+        self.assertTrue(len(inner["locals"]["text"]) <= 203)
+
+    def test_nested_scrubbing(self):
+        """Test that sensitive keys are masked inside container locals."""
+
+        try:
+            raise_with_nested_secrets()
+        except ValueError:
+            frames, truncated = capture_frames(sys.exc_info()[2], scrubber=Scrubber())
+        data = frames[-1]["locals"]["data"]
+        self.assertEqual(data, "{'cards': [{'card_number': [FILTERED]}], "
+                               "'name': 'Bob', 'password': [FILTERED]}")
+
+    def test_frame_limit(self):
+        frames, truncated = capture_frames(capture_with_locals(), frames=1)
+        self.assertEqual([frame["function"] for frame in frames], ['raise_with_locals'])
+        self.assertEqual(truncated, "1 outer frames omitted")
+
+    def test_budget(self):
+        """Test that capture stops, innermost frames first, when out of budget."""
+
+        frames, truncated = capture_frames(capture_with_locals(), bytes=10)
+        self.assertEqual([frame["function"] for frame in frames], ['raise_with_locals'])
+        self.assertTrue(frames[0]["locals"]["__truncated__"])
+        self.assertEqual(truncated, "budget exhausted after 1 of 2 frames")
+
+        frames, truncated = capture_frames(capture_with_locals(), seconds=-1)
+        self.assertEqual(frames, [])
+
+    def test_context_budget(self):
+        """Test that source lines count towards the budget, and are cut."""
+
+        frames, truncated = capture_frames(capture_with_locals(), context=0,
+                                           repr_length=10, bytes=15)
+        self.assertEqual([frame["function"] for frame in frames], ['raise_with_locals'])
+        self.assertEqual(frames[0]["context"]["line"], '    raise ...')
+        self.assertEqual(truncated, "budget exhausted after 1 of 2 frames")
+
+    def test_bad_repr(self):
+        class Broken(object):
+            def __repr__(self):
+                raise RuntimeError("Oops")
+
+        def fail(broken):
+            raise ValueError("Broken")
+        try:
+            fail(Broken())
+        except ValueError:
+            frames, truncated = capture_frames(sys.exc_info()[2], full_reprs=True)
+        self.assertTrue(frames[-1]["locals"]["broken"].startswith('<Broken instance'))
+
+    def test_placeholders(self):
+        """Test that only built-in values are `repr()`ed, unless asked."""
+
+        calls = []
+        class Expensive(object):
+            def __repr__(self):
+                calls.append(1)
+                return 'expensive'
+
+        def fail(expensive, sessions, number, name):
+            raise ValueError("Expensive")
+        try:
+            fail(Expensive(), Session.objects.all(), 42, u'caf\xe9')
+        except ValueError:
+            tb = sys.exc_info()[2]
+
+        frames, truncated = capture_frames(tb)
+        local_reprs = frames[-1]["locals"]
+        self.assertTrue(local_reprs["expensive"].startswith(
+            '<djexceptional.tests.backtrace.Expensive object at 0x'))
+        self.assertTrue(local_reprs["sessions"].startswith(
+            '<django.db.models.query.QuerySet object at 0x'))
+        self.assertEqual(local_reprs["number"], '42')
+        self.assertEqual(local_reprs["name"], "u'caf\\xe9'")
+        self.assertEqual(calls, [])
+
+        frames, truncated = capture_frames(tb, full_reprs=True)
+        local_reprs = frames[-1]["locals"]
+        self.assertEqual(local_reprs["expensive"], 'expensive')
+        self.assertEqual(len(calls), 1)
+        # Querysets are never evaluated.
+        self.assertTrue(local_reprs["sessions"].startswith('<django.db.models.query.QuerySet'))
@@ -0,0 +1,68 @@
+import gzip
+import zlib
+from cStringIO import StringIO
+
+from django.test import TestCase
+
+from djexceptional.compression import (DEFAULT_DICTIONARY, DeflateCodec,
+                                       GzipCodec, NullCodec, get_codec)
+
+
+def gunzip(data):
+    return gzip.GzipFile(fileobj=StringIO(data)).read()
+
+
+PAYLOAD = ('{"request": {"controller": "app.views", "action": "index", '
+           '"parameters": {"q": "%s"}}}' % ('x' * 100000))
+
+
+class CodecTest(TestCase):
+
+    def test_gzip(self):
+        codec = GzipCodec(6)
+        self.assertEqual(gunzip(codec.compress(PAYLOAD)), PAYLOAD)
+        self.assertEqual(codec.headers(), {'Content-Encoding': 'gzip'})
+
+    def test_null(self):
+        codec = NullCodec()
+        self.assertEqual(codec.compress(PAYLOAD), PAYLOAD)
+        self.assertEqual(codec.headers(), {})
+
+    def test_deflate_dictionary(self):
+        """Test that a primed deflate stream round-trips, and is smaller."""
+
+        codec = DeflateCodec(6, DEFAULT_DICTIONARY)
+        small = PAYLOAD[:120]
+        compressed = codec.compress(small)
+        self.assertEqual(codec.decompress(compressed), small)
+        self.failUnless(len(compressed) < len(DeflateCodec(6).compress(small)))
+        self.assertEqual(codec.headers()['Content-Encoding'], 'x-deflate-dict')
+        self.failUnless('X-Exceptional-Dictionary' in codec.headers())
+
+        # Each payload gets its own copy of the primed compressor.
+        self.assertEqual(codec.decompress(codec.compress(PAYLOAD)), PAYLOAD)
+
+    def test_deflate(self):
+        """Test that without a dictionary, payloads are standard HTTP deflate."""
+
+        codec = DeflateCodec(6)
+        self.assertEqual(zlib.decompress(codec.compress(PAYLOAD)), PAYLOAD)
+        self.assertEqual(codec.decompress(codec.compress(PAYLOAD)), PAYLOAD)
+        self.assertEqual(codec.headers(), {'Content-Encoding': 'deflate'})
+
+    def test_compress_chunks(self):
+        """Test that streamed output is buffered, and matches the input."""
+
+        chunks = [PAYLOAD[i:i + 1000] for i in range(0, len(PAYLOAD), 1000)]
+        compressed = list(GzipCodec().compress_chunks(chunks, buffer_size=1 << 20))
+        self.assertEqual(len(compressed), 1)
+        self.assertEqual(gunzip(compressed[0]), PAYLOAD)
+
+        codec = DeflateCodec(1, DEFAULT_DICTIONARY)
+        compressed = ''.join(codec.compress_chunks(chunks, buffer_size=10))
+        self.assertEqual(codec.decompress(compressed), PAYLOAD)
+
+    def test_get_codec(self):
+        self.assertEqual(get_codec('gzip', 9).level, 9)
+        self.failUnless(isinstance(get_codec('none'), NullCodec))
+        self.assertRaises(ValueError, get_codec, 'brotli')
@@ -0,0 +1,165 @@
+from django.test import TestCase
+
+from djexceptional import ExceptionalMiddleware
+from djexceptional.dedup import Deduplicator, fingerprint
+from djexceptional.delivery import SyncDelivery
+from djexceptional.sampling import Sampler
+from djexceptional.throttle import TokenBucket
+
+
+BACKTRACE = [
+    'File "/app/views.py", line 10, in index',
+    '    return render()',
+    'File "/app/views.py", line 20, in render',
+    '    raise ValueError("x")',
+]
+
+
+class FingerprintTest(TestCase):
+
+    def test_ignores_source_lines(self):
+        """Test that only the file/line/function lines are fingerprinted."""
+
+        edited = list(BACKTRACE)
+        edited[1] = '    return render()  # Edited.'
+        self.assertEqual(fingerprint('ValueError', ('app.views', 'index'), BACKTRACE),
+                         fingerprint('ValueError', ('app.views', 'index'), edited))
+
+    def test_distinguishes_errors(self):
+        base = fingerprint('ValueError', ('app.views', 'index'), BACKTRACE)
+        self.assertNotEqual(base, fingerprint('TypeError', ('app.views', 'index'), BACKTRACE))
+        self.assertNotEqual(base, fingerprint('ValueError', ('app.views', 'other'), BACKTRACE))
+        self.assertNotEqual(base, fingerprint('ValueError', ('app.views', 'index'), BACKTRACE[:2]))
+
+
+class DeduplicatorTest(TestCase):
+
+    def setUp(self):
+        self.emitted = []
+        self.dedup = Deduplicator(self.emitted.append, window=60, maxsize=2)
+
+    def test_window(self):
+        """Test that repeats are counted and reported once the window closes."""
+
+        self.failIf(self.dedup.observe('a', {'n': 1}, now=0))
+        self.failUnless(self.dedup.observe('a', {'n': 2}, now=10))
+        self.failUnless(self.dedup.observe('a', {'n': 3}, now=20))
+        self.dedup.expire(now=59)
+        self.assertEqual(self.emitted, [])
+
+        self.dedup.expire(now=60)
+        self.assertEqual(len(self.emitted), 1)
+        self.assertEqual(self.emitted[0]['n'], 1)
+        self.assertEqual(self.emitted[0]['occurrences'], {
+            'count': 2,
+            'weight': 2,
+            'first_seen': '1970-01-01T00:00:00Z',
+            'last_seen': '1970-01-01T00:00:20Z',
+        })
+
+        # A new window begins with a new report.
+        self.failIf(self.dedup.observe('a', {'n': 4}, now=61))
+
+    def test_repeat(self):
+        """Test that a repeat can be counted before its document is built."""
+
+        self.failIf(self.dedup.repeat('a', now=0))
+        self.dedup.observe('a', {'n': 1}, now=0)
+        self.failUnless(self.dedup.repeat('a', now=10))
+        self.failIf(self.dedup.repeat('a', now=60))
+        self.dedup.flush()
+        self.assertEqual(self.emitted[0]['occurrences']['count'], 1)
+
+    def test_weights(self):
+        """Test that the repeats' sampling weights are added up."""
+
+        self.dedup.observe('a', {'n': 1}, now=0, weight=2)
+        self.dedup.observe('a', {'n': 2}, now=1, weight=4)
+        self.dedup.repeat('a', now=2, weight=0.5)
+        self.dedup.flush()
+        self.assertEqual(self.emitted[0]['occurrences']['count'], 2)
+        self.assertEqual(self.emitted[0]['occurrences']['weight'], 4.5)
+
+    def test_no_repeats(self):
+        """Test that nothing extra is reported for errors seen only once."""
+
+        self.dedup.observe('a', {}, now=0)
+        self.dedup.flush()
+        self.assertEqual(self.emitted, [])
+
+    def test_eviction(self):
+        """Test that evicting a fingerprint reports its repeats early."""
+
+        self.dedup.observe('a', {'n': 1}, now=0)
+        self.dedup.observe('a', {'n': 2}, now=1)
+        self.dedup.observe('b', {'n': 3}, now=2)
+        self.dedup.observe('c', {'n': 4}, now=3)
+        self.assertEqual([doc['n'] for doc in self.emitted], [1])
+        self.assertEqual(self.emitted[0]['occurrences']['count'], 1)
+
+
+class DeduplicatingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.middleware = ExceptionalMiddleware()
+        self.middleware.transport.close()
+        self.middleware.delivery = SyncDelivery(self.sent.extend)
+        self.middleware.deduplicator = Deduplicator(self.middleware.delivery.submit)
+
+        self.built = []
+        exception_info = self.middleware.exception_info
+        def counting_exception_info(*args, **kwargs):
+            self.built.append(args[0])
+            return exception_info(*args, **kwargs)
+        self.middleware.exception_info = counting_exception_info
+
+    def test_repeats_not_built(self):
+        """Test that no report is built for a repeat."""
+
+        for i in range(3):
+            try:
+                raise ValueError("Oops")
+            except ValueError:
+                self.middleware.report()
+        self.assertEqual(len(self.built), 1)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.middleware.stats()['deduplicated'], 2)
+
+        self.middleware.deduplicator.flush()
+        self.assertEqual(self.sent[1]['occurrences']['count'], 2)
+
+    def test_repeats_not_limited(self):
+        """Test that repeats neither use up the rate limit nor get shed by it."""
+
+        self.middleware.limiter = TokenBucket(0.001, 1)
+        for i in range(3):
+            try:
+                raise ValueError("Oops")
+            except ValueError:
+                self.middleware.report()
+        stats = self.middleware.stats()
+        self.assertEqual((stats['dropped'], stats['deduplicated']), (0, 2))
+
+        self.middleware.deduplicator.flush()
+        self.assertEqual(self.sent[1]['occurrences']['count'], 2)
+
+    def test_sampled_repeats(self):
+        """Test that the reports still add up to the errors, when sampled too."""
+
+        self.middleware.sampler = Sampler(0.5)
+        for i in range(100):
+            try:
+                raise ValueError("Oops")
+            except ValueError:
+                self.middleware.report()
+        self.middleware.deduplicator.flush()
+        stats = self.middleware.stats()
+
+        first, aggregate = self.sent
+        self.assertEqual(first['sampling']['weight'], 2)
+        self.assertEqual(aggregate['occurrences']['count'], stats['deduplicated'])
+        self.assertEqual(aggregate['occurrences']['weight'],
+                         2 * aggregate['occurrences']['count'])
+        self.assertEqual(first['sampling']['weight'] + aggregate['occurrences']['weight'],
+                         2 * (100 - stats['sampled_out']))
@@ -0,0 +1,82 @@
+import threading
+
+from django.test import TestCase
+
+from djexceptional.delivery import QueuedDelivery, DROP_NEWEST, DROP_OLDEST
+
+
+class QueuedDeliveryTest(TestCase):
+
+    def fill(self, overflow):
+        """Submit 1-4 to a size-2 queue whose only worker is stuck on 1."""
+
+        delivered = []
+        started = threading.Event()
+        release = threading.Event()
+        def handler(document):
+            started.set()
+            release.wait()
+            delivered.extend(document)
+
+        delivery = QueuedDelivery(handler, maxsize=2, overflow=overflow)
+        delivery.submit(1)
+        started.wait(5)
+        for document in (2, 3, 4):
+            delivery.submit(document)
+        release.set()
+        delivery.close(5)
+        return delivery, delivered
+
+    def test_drop_newest(self):
+        """Test that a full queue discards new documents by default."""
+
+        delivery, delivered = self.fill(DROP_NEWEST)
+        self.assertEqual(delivered, [1, 2, 3])
+        self.assertEqual(delivery.dropped, 1)
+
+    def test_drop_oldest(self):
+        """Test that `'drop-oldest'` makes room by discarding queued documents."""
+
+        delivery, delivered = self.fill(DROP_OLDEST)
+        self.assertEqual(delivered, [1, 3, 4])
+        self.assertEqual(delivery.dropped, 1)
+
+    def test_close_flushes(self):
+        """Test that `close()` waits for everything already queued."""
+
+        delivered = []
+        delivery = QueuedDelivery(delivered.extend, maxsize=10, workers=2)
+        for document in range(5):
+            delivery.submit(document)
+        delivery.close(5)
+        self.assertEqual(sorted(delivered), range(5))
+
+    def test_batch_size(self):
+        """Test that a full batch is handed over as soon as it fills up."""
+
+        batches = []
+        delivery = QueuedDelivery(batches.append, batch_size=3,
+                                  batch_interval=60)
+        for document in range(7):
+            delivery.submit(document)
+        delivery.close(5)
+        self.assertEqual(batches, [[0, 1, 2], [3, 4, 5], [6]])
+
+    def test_batch_interval(self):
+        """Test that a partial batch is handed over once its time is up."""
+
+        batches = []
+        flushed = threading.Event()
+        def handler(batch):
+            batches.append(batch)
+            flushed.set()
+
+        delivery = QueuedDelivery(handler, batch_size=100, batch_interval=0.05)
+        delivery.submit(1)
+        delivery.submit(2)
+        flushed.wait(5)
+        self.assertEqual(batches, [[1, 2]])
+        delivery.close(5)
+
+    def test_bad_overflow_policy(self):
+        self.assertRaises(ValueError, QueuedDelivery, None, overflow='drop-all')
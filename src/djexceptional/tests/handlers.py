@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+
+from django.test import TestCase
+
+from djexceptional import Reporter
+from djexceptional.delivery import SyncDelivery
+from djexceptional.handlers import ExceptionalHandler
+
+
+class ExceptionalHandlerTest(TestCase):
+
+    def setUp(self):
+        self.sent = []
+        reporter = Reporter()
+        reporter.delivery = SyncDelivery(self.sent.extend)
+        self.handler = ExceptionalHandler(rate=1, burst=2, reporter=reporter)
+        self.logger = logging.getLogger('djexceptional_test.handlers')
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+    def log_exception(self, logger=None):
+        try:
+            raise ValueError("Oops")
+        except ValueError:
+            (logger or self.logger).exception("Importing %s failed", 'users')
+
+    def test_report(self):
+        self.log_exception()
+        self.handler.queue.close(5)
+
+        self.assertEqual(len(self.sent), 1)
+        document = self.sent[0]
+        self.assertEqual(document["exception"]["exception_class"], 'ValueError')
+        self.assertEqual(document["context"]["logger"], 'djexceptional_test.handlers')
+        self.assertEqual(document["context"]["level"], 'ERROR')
+        self.assertEqual(document["context"]["message"], 'Importing users failed')
+        self.assertEqual(document["context"]["function"], 'log_exception')
+
+    def test_message_formatted(self):
+        """Test that the message is formatted as it was when it was logged."""
+
+        release = threading.Event()
+        report = self.handler.queue.handler
+        def blocked(records):
+            release.wait(5)
+            report(records)
+        self.handler.queue.handler = blocked
+
+        names = ['users']
+        try:
+            raise ValueError("Oops")
+        except ValueError:
+            self.logger.exception("Importing %s failed", names)
+        names.append('groups')
+        release.set()
+        self.handler.queue.close(5)
+
+        self.assertEqual(self.sent[0]["context"]["message"], "Importing ['users'] failed")
+
+    def test_record_unchanged(self):
+        """Test that other handlers see the record as it was logged."""
+
+        records = []
+        class Recorder(logging.Handler):
+            def emit(self, record):
+                records.append((record.msg, record.args))
+        recorder = Recorder()
+        self.logger.addHandler(recorder)
+        try:
+            try:
+                raise ValueError("Oops")
+            except ValueError:
+                self.logger.exception("Importing %s failed", 'users')
+        finally:
+            self.logger.removeHandler(recorder)
+        self.handler.queue.close(5)
+
+        self.assertEqual(records, [("Importing %s failed", ('users',))])
+        self.assertEqual(self.sent[0]["context"]["message"], "Importing users failed")
+
+    def test_ignored(self):
+        """Test that records below the level, or without exceptions, are ignored."""
+
+        self.logger.error("No exception here")
+        try:
+            raise ValueError("Oops")
+        except ValueError:
+            self.logger.warning("Not bad enough", exc_info=True)
+        self.handler.queue.close(5)
+        self.assertEqual(self.sent, [])
+
+    def test_rate_cap(self):
+        """Test that each logger is capped separately."""
+
+        for i in range(5):
+            self.log_exception()
+        other = logging.getLogger('djexceptional_test.other')
+        other.propagate = False
+        other.addHandler(self.handler)
+        try:
+            self.log_exception(other)
+        finally:
+            other.removeHandler(self.handler)
+        self.handler.queue.close(5)
+
+        self.assertEqual(len(self.sent), 3)
+        self.assertEqual(self.handler.stats(), {'dropped': 0, 'rate_limited': 3})
+
+    def test_cheap_emit(self):
+        """Test that emitting doesn't wait for the report to be built."""
+
+        def slow(records):
+            time.sleep(0.5)
+        self.handler.queue.handler = slow
+        start = time.time()
+        self.log_exception()
+        self.assertTrue(time.time() - start < 0.25)
@@ -0,0 +1,41 @@
+from django.test import TestCase
+
+from djexceptional.utils import HeaderTranslator, meta_to_http
+
+
+META = {
+    'HTTP_X_FORWARDED_FOR': '10.0.0.1',
+    'HTTP_USER_AGENT': 'Mozilla/5.0',
+    'HTTP_COOKIE': 'sessionid=abc',
+    'CONTENT_TYPE': 'text/plain',
+    'CONTENT_LENGTH': '0',
+    'REMOTE_ADDR': '127.0.0.1',
+    'wsgi.version': (1, 0),
+}
+
+
+class HeaderTranslatorTest(TestCase):
+
+    def test_meta_to_http(self):
+        self.assertEqual(meta_to_http(META), {
+            'X-Forwarded-For': '10.0.0.1',
+            'User-Agent': 'Mozilla/5.0',
+            'Cookie': 'sessionid=abc',
+            'Content-Type': 'text/plain',
+            'Content-Length': '0',
+        })
+
+    def test_deny(self):
+        translate = HeaderTranslator(deny=['cookie', 'X-FORWARDED-FOR'])
+        self.assertEqual(sorted(translate(META)),
+                         ['Content-Length', 'Content-Type', 'User-Agent'])
+
+    def test_allow(self):
+        translate = HeaderTranslator(allow=['user-agent', 'Cookie'], deny=['cookie'])
+        self.assertEqual(translate(META), {'User-Agent': 'Mozilla/5.0'})
+
+    def test_cache_is_bounded(self):
+        translate = HeaderTranslator(max_keys=3)
+        meta = dict(('HTTP_X_CUSTOM_%d' % i, str(i)) for i in range(10))
+        self.assertEqual(len(translate(meta)), 10)
+        self.assertEqual(len(translate._names), 3)
@@ -0,0 +1,87 @@
+import sys
+
+from django.test import TestCase
+
+from djexceptional import ExceptionalMiddleware, Reporter, hooks
+from djexceptional.dedup import document_fingerprint
+from djexceptional.delivery import SyncDelivery
+
+
+class HooksTest(TestCase):
+
+    def setUp(self):
+        self.previous = hooks._reporter
+        self.sent = []
+        self.reporter = Reporter()
+        self.reporter.delivery = SyncDelivery(self.sent.extend)
+        hooks.set_default_reporter(self.reporter)
+
+    def tearDown(self):
+        hooks._reporter = self.previous
+
+    def test_report(self):
+        try:
+            raise ValueError("Oops")
+        except ValueError:
+            hooks.report(context={'job': 'import', 'password': 'hunter2'})
+
+        document = self.sent[0]
+        self.assertEqual(document["exception"]["exception_class"], 'ValueError')
+        self.assertEqual(document["context"], {'job': 'import', 'password': '[FILTERED]'})
+        self.assertFalse("request" in document)
+        # Reports without a request can still be fingerprinted.
+        self.assertEqual(len(document_fingerprint(document)), 40)
+
+    def test_nothing_to_report(self):
+        sys.exc_clear()
+        hooks.report()
+        self.assertEqual(self.sent, [])
+
+    def test_decorator(self):
+        def fail():
+            raise KeyError("Missing")
+        wrapped = hooks.report_errors(context={'task': 'fail'})(fail)
+        self.assertEqual(wrapped.__name__, 'fail')
+
+        self.assertRaises(KeyError, wrapped)
+        self.assertEqual(self.sent[0]["exception"]["exception_class"], 'KeyError')
+        self.assertEqual(self.sent[0]["context"], {'task': 'fail'})
+
+        hooks.report_errors(reraise=False)(fail)()
+        self.assertEqual(len(self.sent), 2)
+
+    def test_context_manager(self):
+        with hooks.report_errors(reraise=False):
+            raise ValueError("Swallowed")
+        self.assertEqual(len(self.sent), 1)
+
+        try:
+            with hooks.report_errors():
+                raise SystemExit
+        except SystemExit:
+            pass
+        self.assertEqual(len(self.sent), 1)
+
+    def test_excepthook(self):
+        handled = []
+        original = sys.excepthook
+        sys.excepthook = lambda *exc_info: handled.append(exc_info)
+        try:
+            hook = hooks.install_excepthook()
+            try:
+                raise ValueError("Uncaught")
+            except ValueError:
+                exc_info = sys.exc_info()
+            hook(*exc_info)
+        finally:
+            sys.excepthook = original
+
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(handled, [exc_info])
+
+    def test_middleware_shares_reporter(self):
+        hooks._reporter = None
+        middleware = ExceptionalMiddleware()
+        self.assertTrue(hooks.get_reporter() is middleware)
+        ExceptionalMiddleware()
+        self.assertTrue(hooks.get_reporter() is middleware)
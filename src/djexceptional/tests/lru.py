@@ -0,0 +1,37 @@
+from django.test import TestCase
+
+from djexceptional.utils import LRUCache
+
+
+class LRUCacheTest(TestCase):
+
+    def test_eviction(self):
+        """Test that a full cache evicts the least recently used key."""
+
+        cache = LRUCache(2)
+        self.assertEqual(cache.put('a', 1), None)
+        self.assertEqual(cache.put('b', 2), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.put('c', 3), ('b', 2))
+        self.assertEqual(cache.items(), [('a', 1), ('c', 3)])
+        self.assertEqual(len(cache), 2)
+
+    def test_update(self):
+        """Test that overwriting a key refreshes it without evicting anything."""
+
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.put('a', 10), None)
+        self.assertEqual(cache.items(), [('b', 2), ('a', 10)])
+
+    def test_pop_and_clear(self):
+        cache = LRUCache(3)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertEqual(cache.pop('a', 'missing'), 'missing')
+        self.failIf('a' in cache)
+        cache.clear()
+        self.assertEqual(cache.items(), [])
+        self.assertEqual(cache.get('b'), None)
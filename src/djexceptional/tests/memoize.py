@@ -1,3 +1,6 @@
+import time
+import weakref
+
 from django.test import TestCase
 
 from djexceptional.utils import memoize
@@ -81,3 +84,78 @@ class MemoizeTest(TestCase):
         self.assertEqual(increment_counter(), 2)
         self.assertEqual(increment_counter(), 2)
         self.assertEqual(len(counter), 2)
+
+    def test_on_clear(self):
+        """Test that `on_clear()` callbacks run when the cache is cleared."""
+
+        cleared = []
+        def one():
+            return 1
+        one = memoize(one)
+        one.on_clear(lambda: cleared.append(None))
+
+        self.assertEqual(one(), 1)
+        self.assertEqual(len(cleared), 0)
+        one.clear()
+        self.assertEqual(len(cleared), 1)
+
+    def test_kwargs(self):
+        calls = []
+        def power(x, exponent=2):
+            calls.append(None)
+            return x ** exponent
+        power = memoize(power)
+
+        self.assertEqual(power(3), 9)
+        self.assertEqual(power(3, exponent=3), 27)
+        self.assertEqual(power(3, exponent=3), 27)
+        self.assertEqual(len(calls), 2)
+
+    def test_maxsize(self):
+        calls = []
+        def square(x):
+            calls.append(x)
+            return x * x
+        square = memoize(maxsize=2)(square)
+
+        square(1), square(2), square(1), square(3)
+        # 2 was the least recently used, so it was evicted.
+        square(1), square(2)
+        self.assertEqual(calls, [1, 2, 3, 2])
+        self.assertEqual(square.stats(), {'hits': 2, 'misses': 4, 'size': 2})
+
+    def test_ttl(self):
+        calls = []
+        def now():
+            calls.append(None)
+            return len(calls)
+        now = memoize(ttl=0.05)(now)
+
+        self.assertEqual(now(), 1)
+        self.assertEqual(now(), 1)
+        time.sleep(0.1)
+        self.assertEqual(now(), 2)
+
+    def test_unhashable(self):
+        """Test that calls with unhashable arguments just aren't cached."""
+
+        length = memoize(len)
+        self.assertEqual(length([1, 2]), 2)
+        self.assertEqual(length.stats()['size'], 0)
+
+    def test_weak_self(self):
+        """Test that an instance's cached results are freed along with it."""
+
+        class Thing(object):
+            @memoize
+            def value(self):
+                return object()
+
+        thing = Thing()
+        self.assertTrue(thing.value() is thing.value())
+        self.assertFalse(Thing().value() is thing.value())
+
+        ref = weakref.ref(thing)
+        del thing
+        self.assertEqual(ref(), None)
+        self.assertEqual(Thing.value.im_func.stats()['size'], 0)
@@ -0,0 +1,146 @@
+import logging
+import socket
+import threading
+
+from django.test import TestCase
+
+from djexceptional import ExceptionalMiddleware
+from djexceptional.delivery import QueuedDelivery
+from djexceptional.metrics import Histogram, LogMetrics, MemoryMetrics, get_metrics
+from djexceptional.transport import TransportError
+
+
+class RecordingTransport(object):
+
+    def __init__(self, status=None):
+        self.status = status
+
+    def post(self, url, body, headers):
+        if self.status is not None:
+            raise TransportError(self.status, "Unprocessable Entity")
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class MetricsTest(TestCase):
+
+    def test_histogram(self):
+        histogram = Histogram(size=10)
+        for value in range(100):
+            histogram.add(value)
+        summary = histogram.summary()
+        self.assertEqual((summary['count'], summary['total']), (100, 4950))
+        self.assertEqual((summary['min'], summary['max']), (0, 99))
+        # Percentiles only cover the most recent values.
+        self.assertEqual((summary['p50'], summary['p99']), (95, 99))
+
+    def test_memory(self):
+        metrics = MemoryMetrics()
+        metrics.incr('sent')
+        metrics.incr('sent', 2)
+        metrics.timing('send', 0.5)
+        metrics.histogram('bytes.raw', 100)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters'], {'sent': 3})
+        self.assertEqual(snapshot['histograms']['send']['max'], 0.5)
+        self.assertEqual(snapshot['histograms']['bytes.raw']['count'], 1)
+
+    def test_statsd(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        metrics = get_metrics('statsd', {'port': server.getsockname()[1]})
+        try:
+            metrics.incr('sent', 2)
+            metrics.timing('send', 0.0125)
+            metrics.histogram('bytes.raw', 1024)
+            self.assertEqual([server.recv(512) for i in range(3)],
+                             ['djexceptional.sent:2|c',
+                              'djexceptional.send:12.500|ms',
+                              'djexceptional.bytes.raw:1024|h'])
+        finally:
+            metrics.close()
+            server.close()
+
+    def test_log(self):
+        logger = logging.getLogger('djexceptional_test.metrics')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = ListHandler()
+        logger.addHandler(handler)
+        try:
+            metrics = LogMetrics(logger)
+            metrics.incr('failed')
+            metrics.timing('build', 0.25)
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(handler.messages, ["counter failed=1", "timing build=0.250000"])
+
+    def test_get_metrics(self):
+        self.assertEqual(get_metrics(None), None)
+        self.assertRaises(ValueError, get_metrics, 'graphite')
+
+
+class ReporterMetricsTest(TestCase):
+
+    def setUp(self):
+        self.middleware = ExceptionalMiddleware()
+        self.middleware.transport.close()
+        self.middleware.metrics = MemoryMetrics()
+
+    def report(self):
+        try:
+            raise ValueError("Oops")
+        except ValueError:
+            self.middleware.report(context={'task': 'metrics'})
+
+    def test_stages(self):
+        self.middleware.transport = RecordingTransport()
+        self.report()
+
+        snapshot = self.middleware.metrics.snapshot()
+        self.assertEqual(snapshot['counters'], {'sent': 1})
+        histograms = snapshot['histograms']
+        for name in ('build', 'serialize', 'compress', 'enqueue', 'send',
+                     'bytes.raw', 'bytes.compressed'):
+            self.assertEqual(histograms[name]['count'], 1, name)
+        self.assertTrue(histograms['bytes.compressed']['max'] <
+                        histograms['bytes.raw']['max'])
+
+    def test_failure(self):
+        self.middleware.transport = RecordingTransport(status=422)
+        logging.getLogger('djexceptional').disabled = True
+        try:
+            self.report()
+        finally:
+            logging.getLogger('djexceptional').disabled = False
+
+        snapshot = self.middleware.metrics.snapshot()
+        self.assertEqual(snapshot['counters'], {'failed': 1})
+        self.assertEqual(snapshot['histograms']['send']['count'], 1)
+        self.assertEqual(self.middleware.stats()['failed'], 1)
+
+    def test_dropped(self):
+        """Test that reports dropped by a full queue are counted."""
+
+        release = threading.Event()
+        self.middleware.delivery = QueuedDelivery(lambda documents: release.wait(5),
+                                                  maxsize=1,
+                                                  on_drop=self.middleware.count_dropped)
+        for i in range(4):
+            self.middleware.submit({"exception": {"message": "Oops"}}, 'abc')
+        release.set()
+        self.middleware.delivery.close(5)
+
+        dropped = self.middleware.delivery.dropped
+        self.assertTrue(dropped >= 2)
+        self.assertEqual(self.middleware.metrics.snapshot()['counters']['dropped'], dropped)
+        self.assertEqual(self.middleware.stats()['dropped'], dropped)
@@ -0,0 +1,203 @@
+import gzip
+import os
+from cStringIO import StringIO
+
+from django.http import HttpRequest
+from django.test import TestCase
+from django.utils import simplejson
+
+from djexceptional import ExceptionalMiddleware
+from djexceptional.serializers import get_serializer
+from djexceptional.transport import TransportError
+from djexceptional.utils import WeakKeyCache, splice_json
+
+
+def view(request):
+    pass
+
+
+class ClassBasedView(object):
+
+    def method(self, request):
+        pass
+
+    def __call__(self, request):
+        pass
+
+
+def make_request(path):
+    request = HttpRequest()
+    request.path = request.path_info = path
+    return request
+
+
+class ResolveViewTest(TestCase):
+
+    urls = 'djexceptional.tests.middleware'
+
+    def setUp(self):
+        self.middleware = ExceptionalMiddleware()
+
+    def test_recorded_by_process_view(self):
+        """Test that the view recorded by `process_view()` is used as-is."""
+
+        request = make_request('/not/in/the/urlconf/')
+        self.middleware.process_view(request, view, (1,), {'a': 2})
+        self.assertEqual(self.middleware.resolve_view(request),
+                         (view, (1,), {'a': 2}))
+
+    def test_resolve_fallback(self):
+        """Test that the URL is resolved if `process_view()` didn't run."""
+
+        self.assertEqual(self.middleware.resolve_view(make_request('/view/3/')),
+                         (view, (), {'id': '3'}))
+
+    def test_unresolvable(self):
+        self.assertEqual(self.middleware.resolve_view(make_request('/nowhere/')),
+                         (None, (), {}))
+
+
+class ViewNameTest(TestCase):
+
+    def test_view_names(self):
+        get_view_name = ExceptionalMiddleware.get_view_name
+        self.assertEqual(get_view_name(view),
+                         ('djexceptional.tests.middleware', 'view'))
+        self.assertEqual(get_view_name(ClassBasedView()),
+                         ('djexceptional.tests.middleware', 'ClassBasedView'))
+        self.assertEqual(get_view_name(ClassBasedView().method),
+                         ('djexceptional.tests.middleware.ClassBasedView', 'method'))
+
+    def test_cache(self):
+        """Test that names are cached per view, and freed along with it."""
+
+        calls = []
+        def name(view):
+            calls.append(view)
+            return ('module', 'name')
+        cache = WeakKeyCache(name)
+
+        instance = ClassBasedView()
+        self.assertEqual(cache(instance), ('module', 'name'))
+        self.assertEqual(cache(instance), ('module', 'name'))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+        del calls[:], instance
+        self.assertEqual(cache.stats()['size'], 0)
+
+        # Objects which can't be weakly referenced are cached strongly.
+        cache(1)
+        cache(1)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()['size'], 1)
+
+
+from django.conf.urls.defaults import patterns
+
+urlpatterns = patterns('',
+    (r'^view/(?P<id>\d+)/$', view),
+)
+
+
+class ScriptedTransport(object):
+
+    """Answers each POST with the next status in `statuses` (200 once they run out)."""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.posted = []
+
+    def post(self, url, body, headers):
+        self.posted.append(gzip.GzipFile(fileobj=StringIO(body)).read().startswith('['))
+        if self.statuses:
+            status = self.statuses.pop(0)
+            if status != 200:
+                raise TransportError(status, "Rejected")
+
+
+class SendTest(TestCase):
+
+    def setUp(self):
+        self.middleware = ExceptionalMiddleware()
+        self.middleware.transport.close()
+        self.documents = [{"exception": {"message": "one"}},
+                          {"exception": {"message": "two"}}]
+
+    def test_batch_rejected(self):
+        """Test that a rejected batch is re-sent, and only counted once."""
+
+        self.middleware.transport = transport = ScriptedTransport(422)
+        self.middleware.send(self.documents)
+        self.assertEqual(transport.posted, [True, False, False])
+        stats = self.middleware.stats()
+        self.assertEqual((stats['sent'], stats['failed']), (2, 0))
+        # One rejection might have been down to a bad error...
+        self.assertTrue(self.middleware.accepts_batches)
+
+        # ...but two in a row mean the endpoint doesn't take batches.
+        transport.statuses = [400]
+        self.middleware.send(self.documents)
+        self.assertFalse(self.middleware.accepts_batches)
+        self.middleware.send(self.documents)
+        self.assertEqual(transport.posted, [True, False, False, True, False, False,
+                                            False, False])
+
+    def test_batch_unsupported(self):
+        self.middleware.transport = ScriptedTransport(405)
+        self.middleware.send(self.documents)
+        self.assertFalse(self.middleware.accepts_batches)
+        self.assertEqual(self.middleware.stats()['sent'], 2)
+
+    def test_single_rejected(self):
+        self.middleware.transport = ScriptedTransport(422)
+        self.middleware.send(self.documents[:1])
+        stats = self.middleware.stats()
+        self.assertEqual((stats['sent'], stats['failed']), (0, 1))
+
+
+class SerializeTest(TestCase):
+
+    def setUp(self):
+        self.middleware = ExceptionalMiddleware()
+        self.middleware.transport.close()
+        self.document = {"exception": {"message": "Oops", "backtrace": []},
+                         "request": {"controller": "app.views", "action": "index"}}
+
+    def tearDown(self):
+        os.environ.pop('DJEXCEPTIONAL_TEST', None)
+        self.middleware.environment_info.clear()
+
+    def expected(self, document):
+        expected = dict(self.middleware.environment_info())
+        expected.update(document)
+        return simplejson.loads(simplejson.dumps(expected))
+
+    def test_splice_json(self):
+        self.assertEqual(splice_json('"a": 1', '{"b": 2}'), '{"a": 1, "b": 2}')
+        self.assertEqual(splice_json('"a": 1', '{}'), '{"a": 1}')
+
+    def test_environment_spliced(self):
+        """Test that the serialized document has the environment spliced in."""
+
+        for name in ('fast', 'resilient'):
+            self.middleware.serializer = get_serializer(name)
+            self.middleware.environment_info.clear()
+            self.assertEqual(simplejson.loads(self.middleware.serialize(self.document)),
+                             self.expected(self.document))
+            self.assertEqual(simplejson.loads(self.middleware.serialize({})),
+                             self.expected({}))
+
+    def test_environment_cleared(self):
+        """Test that clearing `environment_info` re-encodes the environment."""
+
+        self.middleware.serialize(self.document)
+        os.environ['DJEXCEPTIONAL_TEST'] = 'yes'
+        env = simplejson.loads(self.middleware.serialize(self.document))[
+            "application_environment"]["env"]
+        self.failIf('DJEXCEPTIONAL_TEST' in env)
+
+        self.middleware.environment_info.clear()
+        env = simplejson.loads(self.middleware.serialize(self.document))[
+            "application_environment"]["env"]
+        self.assertEqual(env['DJEXCEPTIONAL_TEST'], 'yes')
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import threading
+
+from django.test import TestCase
+from django.utils import simplejson
+
+from djexceptional import ExceptionalMiddleware
+from djexceptional.dedup import Occurrence
+from djexceptional.delivery import RelayDelivery
+from djexceptional.relay import RelayServer, parse_message, relay_message
+
+
+DOCUMENT = {
+    "request": {"controller": "module", "action": "view"},
+    "exception": {"exception_class": "ValueError", "message": "Oops",
+                  "backtrace": ['File "a.py", line 1, in view']},
+}
+
+
+class RelayTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'relay.sock')
+        self.received = []
+        self.server = RelayServer(self.path,
+                                  lambda document, fingerprint, weight:
+                                      self.received.append((fingerprint, document)))
+        self.sent = []
+        self.middleware = ExceptionalMiddleware(delivery='relay')
+        self.delivery = RelayDelivery(self.sent.extend, self.path,
+                                      self.middleware.relay_message)
+
+    def tearDown(self):
+        self.delivery.close()
+        self.server.close()
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        self.delivery.submit(DOCUMENT)
+        self.server.handle_one()
+
+        fingerprint, document_json = self.received[0]
+        self.assertEqual(len(fingerprint), 40)
+        document = simplejson.loads(document_json)
+        self.assertEqual(document["exception"]["message"], "Oops")
+        self.assertTrue("application_environment" in document)
+        self.assertEqual(self.sent, [])
+
+        # The relay sends the document on as it is.
+        self.assertEqual(self.middleware.serialize(document_json), document_json)
+
+    def test_relay_down(self):
+        """Test that documents are queued to be sent when there's no relay."""
+
+        threads = []
+        def handler(documents):
+            threads.append(threading.currentThread())
+            self.sent.extend(documents)
+        self.delivery.handler = handler
+
+        self.server.close()
+        self.delivery.submit(DOCUMENT)
+        self.assertFalse(self.delivery.relaying)
+        self.delivery.close(5)
+        self.assertEqual(self.sent, [DOCUMENT])
+        self.assertNotEqual(threads, [threading.currentThread()])
+
+    def test_too_big(self):
+        """Test that a document too big for the relay is queued instead."""
+
+        self.delivery.max_message = 100
+        self.delivery.submit(DOCUMENT)
+        self.delivery.close(5)
+        self.assertEqual(self.sent, [DOCUMENT])
+        self.assertTrue(self.delivery.relaying)
+
+    def test_truncated(self):
+        """Test that the relay ignores a message bigger than it reads."""
+
+        self.server._buffer = bytearray(100)
+        self.delivery.submit(DOCUMENT)
+        self.server.handle_one()
+        self.assertEqual(self.received, [])
+        self.assertEqual(self.server.malformed, 1)
+
+    def test_weight(self):
+        """Test that a sampled document's weight reaches the relay."""
+
+        self.assertEqual(parse_message(relay_message('abc', '{}')), ('abc', '{}', 1))
+        self.assertEqual(parse_message(relay_message('abc', '{}', 2.5)), ('abc', '{}', 2.5))
+
+        weights = []
+        self.server.submit = lambda document, fingerprint, weight: weights.append(weight)
+        document = dict(DOCUMENT, sampling={"rate": 0.25, "weight": 4})
+        self.delivery.submit(document)
+        self.server.handle_one()
+        self.assertEqual(weights, [4])
+
+    def test_malformed(self):
+        self.assertRaises(ValueError, parse_message, 'no newline')
+        self.assertRaises(ValueError, parse_message, 'abc lots\n{}')
+        self.server.handle('abc\nnot json')
+        self.assertEqual(self.received, [])
+        self.assertEqual(self.server.malformed, 1)
+
+    def test_aggregate_serialized(self):
+        """Test that repeats are spliced into a document the relay holds."""
+
+        occurrence = Occurrence(self.middleware.serialize(DOCUMENT), 0)
+        occurrence.count = 2
+        document = simplejson.loads(occurrence.aggregate())
+        self.assertEqual(document["occurrences"]["count"], 2)
+        self.assertEqual(document["exception"]["message"], "Oops")
@@ -0,0 +1,67 @@
+import random
+import sys
+
+from django.http import HttpRequest
+from django.test import TestCase
+
+from djexceptional import ExceptionalMiddleware
+from djexceptional.dedup import document_fingerprint
+from djexceptional.sampling import Sampler
+from djexceptional.tests.middleware import view
+
+
+class SamplerTest(TestCase):
+
+    def test_rates(self):
+        sampler = Sampler(0.5, {'django.http.Http404': 0.1, 'KeyError': 1},
+                          random=lambda: 0.3)
+        self.assertEqual(sampler.sample('ValueError'), 2)
+        self.assertEqual(sampler.sample('django.http.Http404'), None)
+        self.assertEqual(sampler.sample('KeyError'), 1)
+
+        sampler.random = lambda: 0.05
+        self.assertEqual(sampler.sample('django.http.Http404'), 10)
+
+    def test_off(self):
+        self.assertEqual(Sampler(0).sample('ValueError'), None)
+        self.assertEqual(Sampler().sample('ValueError'), 1)
+        self.assertFalse(Sampler().adaptive)
+
+    def test_adaptive(self):
+        """Test that a fingerprint's rate falls as it's seen more often."""
+
+        sampler = Sampler(target=2, window=10)
+        self.assertTrue(sampler.adaptive)
+        self.assertEqual([sampler.probability('ValueError', 'abc', now=0)
+                          for i in range(4)],
+                         [1, 1, 2 / 3.0, 0.5])
+        # Other fingerprints are counted separately...
+        self.assertEqual(sampler.probability('ValueError', 'def', now=0), 1)
+        # ...and counts start again with each window.
+        self.assertEqual(sampler.probability('ValueError', 'abc', now=10), 1)
+
+    def test_weights(self):
+        """Test that the weights of the sampled errors add up to the total."""
+
+        sampler = Sampler(target=1000, random=random.Random(0).random)
+        total = sum(sampler.sample('ValueError', 'abc', now=0) or 0
+                    for i in range(10000))
+        self.assertTrue(9000 < total < 11000, total)
+
+
+class ErrorFingerprintTest(TestCase):
+
+    def test_matches_document(self):
+        middleware = ExceptionalMiddleware()
+        request = HttpRequest()
+        middleware.process_view(request, view, (), {})
+        try:
+            raise ValueError("Oops")
+        except ValueError, exc:
+            tb = sys.exc_info()[2]
+
+        document = middleware.exception_info(exc, tb)
+        document["request"] = {"controller": 'djexceptional.tests.middleware',
+                               "action": 'view'}
+        self.assertEqual(middleware.error_fingerprint(request, exc, tb),
+                         document_fingerprint(document))
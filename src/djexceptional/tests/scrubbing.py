@@ -0,0 +1,39 @@
+from django.test import TestCase
+
+from djexceptional.scrubbing import FILTERED, Scrubber
+
+
+class ScrubberTest(TestCase):
+
+    def test_nested(self):
+        """Test that sensitive keys are masked at every level."""
+
+        scrubber = Scrubber()
+        value = {
+            'username': 'bob',
+            'Password': 'hunter2',
+            'profile': {'API_KEY': 'abc', 'name': 'Bob',
+                        'cards': [{'credit_card': '4111', 'label': 'work'}]},
+            0: 'positional',
+        }
+        self.assertEqual(scrubber.scrub(value), {
+            'username': 'bob',
+            'Password': FILTERED,
+            'profile': {'API_KEY': FILTERED, 'name': 'Bob',
+                        'cards': [{'credit_card': FILTERED, 'label': 'work'}]},
+            0: 'positional',
+        })
+        # The original is left alone.
+        self.assertEqual(value['Password'], 'hunter2')
+
+    def test_custom_patterns(self):
+        scrubber = Scrubber([r'^pin$', r'ssn'], mask='***')
+        self.assertEqual(scrubber.scrub({'pin': 1, 'pinned': 2, 'user_ssn': 3}),
+                         {'pin': '***', 'pinned': 2, 'user_ssn': '***'})
+        self.assertEqual(Scrubber([]).scrub({'password': 'x'}), {'password': 'x'})
+
+    def test_verdict_cache_is_bounded(self):
+        scrubber = Scrubber(max_keys=2)
+        scrubber.scrub(dict(('key%d' % i, i) for i in range(10)))
+        self.assertEqual(len(scrubber._verdicts), 2)
+        self.failUnless(scrubber.is_sensitive('secret_key'))
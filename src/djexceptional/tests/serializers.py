@@ -0,0 +1,56 @@
+import datetime
+import decimal
+
+from django.test import TestCase
+from django.utils import simplejson
+
+from djexceptional.serializers import FastSerializer, ResilientSerializer, get_serializer
+from djexceptional.utils import json_dumps
+
+
+class Opaque(object):
+    def __repr__(self):
+        return '<Opaque>'
+
+
+DOCUMENT = {
+    "request": {
+        "session": {
+            "last_login": datetime.datetime(2010, 3, 4, 5, 6, 7),
+            "birthday": datetime.date(1970, 1, 2),
+            "alarm": datetime.time(6, 30),
+            "balance": decimal.Decimal("12.50"),
+            "cart": Opaque(),
+            "items": [1, 2.5, None, True, u"caf\xe9"],
+        },
+        "parameters": {0: "positional", "q": "search"},
+    },
+}
+
+
+class SerializerTest(TestCase):
+
+    def test_fast_matches_resilient(self):
+        """Test that the fast path encodes everything as the resilient one does."""
+
+        fast = simplejson.loads(FastSerializer().dumps(DOCUMENT))
+        resilient = simplejson.loads(ResilientSerializer().dumps(DOCUMENT))
+        self.assertEqual(fast, resilient)
+        session = fast["request"]["session"]
+        self.assertEqual(session["last_login"], "2010-03-04 05:06:07")
+        self.assertEqual(session["balance"], "12.50")
+        self.assertEqual(session["cart"], "<Opaque>")
+
+    def test_fallback(self):
+        """Test that documents the fast encoder chokes on are still encoded."""
+
+        serializer = FastSerializer()
+        def broken(obj):
+            raise ValueError("Choked")
+        if serializer.encoder is not None:
+            serializer.encoder.encode = broken
+        self.assertEqual(serializer.dumps(DOCUMENT), json_dumps(DOCUMENT))
+
+    def test_get_serializer(self):
+        self.assertEqual(get_serializer('fast').name, 'fast')
+        self.assertRaises(ValueError, get_serializer, 'pickle')
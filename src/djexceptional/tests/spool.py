@@ -0,0 +1,152 @@
+import os
+import shutil
+import socket
+import tempfile
+
+from django.test import TestCase
+
+from djexceptional import ExceptionalMiddleware
+from djexceptional.spool import Spool, read_segment, replay, segments
+from djexceptional.transport import TransportError
+
+
+class SpoolTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        spool = Spool(self.directory)
+        spool.append('\x1f\x8bone', {'Content-Encoding': 'gzip'}, 1)
+        spool.append('two', {}, 3)
+
+        # Still being written, by a process which is alive.
+        self.assertEqual(segments(self.directory), [])
+        spool.close()
+
+        paths = segments(self.directory)
+        self.assertEqual(len(paths), 1)
+        self.assertEqual(list(read_segment(paths[0])),
+                         [('\x1f\x8bone', {'Content-Encoding': 'gzip'}, 1),
+                          ('two', {}, 3)])
+
+    def test_rotation(self):
+        spool = Spool(self.directory, segment_bytes=1)
+        for payload in ('one', 'two', 'three'):
+            spool.append(payload, {})
+        spool.close()
+
+        paths = segments(self.directory)
+        self.assertEqual([[payload for payload, headers, count in read_segment(path)]
+                          for path in paths],
+                         [['one'], ['two'], ['three']])
+
+    def test_torn_write(self):
+        """Test that reading stops at a half-written record."""
+
+        spool = Spool(self.directory)
+        spool.append('one', {})
+        spool.append('two', {})
+        spool.close()
+
+        path = segments(self.directory)[0]
+        fp = open(path, 'r+b')
+        try:
+            fp.truncate(os.path.getsize(path) - 1)
+        finally:
+            fp.close()
+        self.assertEqual([payload for payload, headers, count in read_segment(path)],
+                         ['one'])
+
+
+class ReplayTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        spool = Spool(self.directory, segment_bytes=1)
+        for payload, count in (('ok', 2), ('reject', 1), ('reject', 3), ('fail', 2)):
+            spool.append(payload, {'Content-Encoding': 'gzip'}, count)
+        spool.close()
+        self.posted = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def post(self, payload, headers):
+        self.posted.append((payload, headers))
+        if payload == 'reject':
+            raise TransportError(422, 'Unprocessable Entity', '')
+        elif payload == 'fail':
+            raise socket.error("Connection refused")
+
+    def test_replay(self):
+        spool = Spool(self.directory)
+        results = replay(self.directory, self.post, workers=2, spool=spool)
+        self.assertEqual(results, {'sent': 2, 'rejected': 4, 'failed': 2})
+        self.assertEqual(sorted(payload for payload, headers in self.posted),
+                         ['fail', 'ok', 'reject', 'reject'])
+        self.assertEqual(self.posted[0][1], {'Content-Encoding': 'gzip'})
+
+        # Only the failure is left, in its segment as it was, since nothing
+        # in it could be sent.
+        records = []
+        for path in segments(self.directory):
+            records.extend(read_segment(path))
+        self.assertEqual(records, [('fail', {'Content-Encoding': 'gzip'}, 2)])
+
+    def test_endpoint_down(self):
+        """Test that replay stops at a segment none of which could be sent."""
+
+        def post(payload, headers):
+            self.posted.append(payload)
+            raise socket.error("Connection refused")
+
+        results = replay(self.directory, post)
+        self.assertEqual(results, {'sent': 0, 'rejected': 0, 'failed': 2})
+        self.assertEqual(self.posted, ['ok'])
+        self.assertEqual(len(segments(self.directory)), 4)
+
+
+class FailingTransport(object):
+
+    def post(self, url, body, headers):
+        raise socket.error("Connection refused")
+
+
+class SpoolingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.middleware = ExceptionalMiddleware()
+        self.middleware.transport = FailingTransport()
+        self.middleware.spool = Spool(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_spool_on_failure(self):
+        """Test that an undeliverable payload is spooled instead of lost."""
+
+        self.middleware.send([{"exception": {"message": "one"}}])
+        self.middleware.spool.close()
+
+        records = list(read_segment(segments(self.directory)[0]))
+        self.assertEqual(len(records), 1)
+        payload, headers, count = records[0]
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(self.middleware.stats()['spooled'], 1)
+        self.assertEqual(self.middleware.stats()['failed'], 1)
+
+    def test_spool_batch(self):
+        """Test that a batch is spooled one error per payload."""
+
+        self.middleware.send([{"exception": {"message": "one"}},
+                              {"exception": {"message": "two"}}])
+        self.middleware.spool.close()
+
+        records = list(read_segment(segments(self.directory)[0]))
+        self.assertEqual([count for payload, headers, count in records], [1, 1])
+        self.assertEqual(self.middleware.stats()['spooled'], 2)
@@ -0,0 +1,54 @@
+from django.test import TestCase
+
+from djexceptional.throttle import CircuitBreaker, TokenBucket
+
+
+class TokenBucketTest(TestCase):
+
+    def test_burst_and_refill(self):
+        bucket = TokenBucket(rate=2, burst=3)
+        now = bucket._updated
+        self.failUnless(bucket.consume(now=now))
+        self.failUnless(bucket.consume(now=now))
+        self.failUnless(bucket.consume(now=now))
+        self.failIf(bucket.consume(now=now))
+
+        # Two tokens a second come back, up to the size of the burst.
+        self.failUnless(bucket.consume(now=now + 0.5))
+        self.failIf(bucket.consume(now=now + 0.5))
+        self.failUnless(bucket.consume(now=now + 100))
+        self.failUnless(bucket.consume(now=now + 100))
+        self.failUnless(bucket.consume(now=now + 100))
+        self.failIf(bucket.consume(now=now + 100))
+
+
+class CircuitBreakerTest(TestCase):
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(threshold=3, reset_timeout=10)
+        self.failIf(breaker.record_failure(now=0))
+        breaker.record_success()
+        self.failIf(breaker.record_failure(now=0))
+        self.failIf(breaker.record_failure(now=0))
+        self.failUnless(breaker.record_failure(now=0))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.failIf(breaker.allow(now=9))
+
+    def test_half_open_probe(self):
+        """Test that only one probe is let through once the timeout is up."""
+
+        breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+        breaker.record_failure(now=0)
+        self.failUnless(breaker.allow(now=10))
+        self.failIf(breaker.allow(now=10))
+
+        # A failed probe re-opens the breaker for another timeout...
+        self.failUnless(breaker.record_failure(now=10))
+        self.failIf(breaker.allow(now=19))
+        self.failUnless(breaker.allow(now=20))
+
+        # ...and a successful one closes it.
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.failUnless(breaker.allow(now=20))
+        self.failUnless(breaker.allow(now=20))
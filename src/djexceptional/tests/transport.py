@@ -0,0 +1,225 @@
+import BaseHTTPServer
+import SocketServer
+import socket
+import threading
+import time
+
+from django.http import HttpRequest
+from django.test import TestCase
+
+from djexceptional import ExceptionalMiddleware
+from djexceptional.delivery import QueuedDelivery
+from djexceptional.tests.middleware import view
+from djexceptional.transport import ChunkedBody, HTTPTransport, TransportError
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    """
+    Answers POSTs with the status given in the path, e.g. `/201`, or after
+    half a second for `/slow`.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = self.read_chunked()
+        else:
+            body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.path, body, self.client_address))
+        if self.path == '/slow':
+            time.sleep(0.5)
+            self.path = '/'
+
+        status = int(self.path.strip('/').split('?')[0] or 200)
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        if self.server.drop_connections:
+            # Hang up without telling the client it shouldn't reuse the
+            # connection, like a server whose keep-alive timeout has expired.
+            self.close_connection = 1
+
+    def read_chunked(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+            if not size:
+                return ''.join(chunks)
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPTransportTest(TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.requests = []
+        self.server.drop_connections = False
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+        self.transport = HTTPTransport(connect_timeout=1, read_timeout=1)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        """Test that consecutive requests share one connection."""
+
+        self.assertEqual(self.transport.post(self.url + '/?a=1', 'one', {}), 'one')
+        self.assertEqual(self.transport.post(self.url + '/?a=2', 'two', {}), 'two')
+
+        paths = [path for path, body, client in self.server.requests]
+        clients = set(client for path, body, client in self.server.requests)
+        self.assertEqual(paths, ['/?a=1', '/?a=2'])
+        self.assertEqual(len(clients), 1)
+
+    def test_error_status(self):
+        """Test that a non-2xx response raises `TransportError`."""
+
+        try:
+            self.transport.post(self.url + '/415', 'body', {})
+        except TransportError, exc:
+            self.assertEqual(exc.status, 415)
+        else:
+            self.fail("TransportError not raised")
+
+    def test_reconnect(self):
+        """Test that a request on a dead pooled connection is retried."""
+
+        self.server.drop_connections = True
+        self.assertEqual(self.transport.post(self.url, 'one', {}), 'one')
+        self.assertEqual(self.transport.post(self.url, 'two', {}), 'two')
+
+        clients = set(client for path, body, client in self.server.requests)
+        self.assertEqual(len(clients), 2)
+
+    def test_chunked_body(self):
+        """Test that a `ChunkedBody` is streamed, and restarted on a retry."""
+
+        body = ChunkedBody(lambda: iter(['one', '', 'two', 'three']))
+        self.assertEqual(self.transport.post(self.url, body, {}), 'onetwothree')
+
+        self.server.drop_connections = True
+        self.transport.post(self.url, 'prime', {})
+        self.assertEqual(self.transport.post(self.url, body, {}), 'onetwothree')
+
+    def test_timeout_not_retried(self):
+        """Test that a request the server may have received isn't sent again."""
+
+        self.transport.read_timeout = 0.25
+        self.transport.post(self.url + '/', 'prime', {})
+        start = time.time()
+        self.assertRaises(socket.timeout, self.transport.post, self.url + '/slow', 'one', {})
+        self.assertTrue(time.time() - start < 0.5)
+        time.sleep(0.5)
+        self.assertEqual([path for path, body, client in self.server.requests],
+                         ['/', '/slow'])
+
+    def test_body_error_closes(self):
+        """Test that a connection is closed if its `ChunkedBody` fails."""
+
+        self.transport.post(self.url, 'prime', {})
+        conn = self.transport._idle.values()[0][0]
+
+        def chunks():
+            yield 'one'
+            raise ValueError("Oops")
+        self.assertRaises(ValueError, self.transport.post, self.url,
+                          ChunkedBody(chunks), {})
+        self.assertEqual(conn.sock, None)
+        self.assertEqual(self.transport._idle.values(), [[]])
+
+
+class SlowHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    """Takes `server.delay` seconds over each POST, counting those in flight."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        server = self.server
+        server.lock.acquire()
+        try:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        finally:
+            server.lock.release()
+        time.sleep(server.delay)
+        server.lock.acquire()
+        try:
+            server.in_flight -= 1
+            server.received += 1
+        finally:
+            server.lock.release()
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class SlowServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class QueuedMiddlewareTest(TestCase):
+
+    """
+    Test that with queued delivery, a slow endpoint holds up neither the
+    request nor more than `workers` connections.
+    """
+
+    def setUp(self):
+        self.server = SlowServer(('127.0.0.1', 0), SlowHandler)
+        self.server.lock = threading.Lock()
+        self.server.delay = 0.2
+        self.server.in_flight = self.server.max_in_flight = self.server.received = 0
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+
+        self.middleware = ExceptionalMiddleware()
+        self.middleware.transport.close()
+        self.middleware.api_endpoint = 'http://127.0.0.1:%d/api/errors' % (
+            self.server.server_port,)
+        self.middleware.transport = HTTPTransport(connect_timeout=1, read_timeout=5)
+        self.middleware.delivery = QueuedDelivery(self.middleware.send, workers=2)
+
+    def tearDown(self):
+        self.middleware.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_slow_endpoint(self):
+        start = time.time()
+        for i in range(6):
+            request = HttpRequest()
+            request.session = {}
+            request.method = 'GET'
+            request.path = '/'
+            request.META = {'REMOTE_ADDR': '127.0.0.1', 'SERVER_NAME': 'testserver',
+                            'SERVER_PORT': '80'}
+            self.middleware.process_view(request, view, (), {})
+            try:
+                raise ValueError("Oops %d" % i)
+            except ValueError, exc:
+                self.middleware.process_exception(request, exc)
+        self.assertTrue(time.time() - start < self.server.delay)
+
+        self.middleware.delivery.close(10)
+        self.assertEqual(self.server.received, 6)
+        self.assertEqual(self.server.max_in_flight, 2)
+        self.assertEqual(self.middleware.stats()['sent'], 6)
@@ -0,0 +1,46 @@
+import datetime
+
+from django.test import TestCase
+
+from djexceptional.truncation import truncate
+
+
+class Opaque(object):
+    def __repr__(self):
+        return '<Opaque %s>' % ('x' * 100,)
+
+
+class TruncateTest(TestCase):
+
+    def test_within_budget(self):
+        """Test that small values come back unchanged."""
+
+        value = {'a': [1, 2.5, None, u'text'], 'b': datetime.date(2010, 1, 1)}
+        self.assertEqual(truncate(value, items=10, bytes=1000), value)
+        self.assertEqual(truncate(value), value)
+
+    def test_items(self):
+        truncated = truncate(dict((str(i), i) for i in range(10)), items=4)
+        self.assertEqual(len(truncated), 5)
+        self.assertEqual(truncated['__truncated__'], '6 more items')
+
+        self.assertEqual(truncate(range(5), items=2), [0, 1, '...[3 more items]'])
+        self.assertEqual(truncate(range(5), items=2, tail=True),
+                         ['...[3 more items]', 3, 4])
+
+    def test_bytes(self):
+        """Test that strings are cut short once the byte budget runs out."""
+
+        self.assertEqual(truncate('x' * 100, bytes=10),
+                         'x' * 10 + '...[90 more characters]')
+        self.assertEqual(truncate(['abc', 'def', 'ghi'], bytes=4),
+                         ['abc', 'd...[2 more characters]', '...[1 more items]'])
+        self.assertEqual(truncate(['abc', 'def', 'ghi'], bytes=4, tail=True),
+                         ['...[1 more items]', 'd...[2 more characters]', 'ghi'])
+
+    def test_depth_and_objects(self):
+        """Test that deep nesting and odd objects become truncated reprs."""
+
+        self.assertEqual(truncate({'a': {'b': [1]}}, depth=1), {'a': "{'b': [1]}"})
+        truncated = truncate({'o': Opaque()}, bytes=20)
+        self.failUnless(truncated['o'].startswith('<Opaque xxxxxxxxxxx...['))
@@ -0,0 +1,107 @@
+"""Limits on how hard we'll try to report errors."""
+
+import threading
+import time
+
+
+class TokenBucket(object):
+
+    """
+    Allow `rate` events per second on average, in bursts of up to `burst`.
+
+    The bucket starts full; each event takes a token, and tokens are added
+    back continuously at `rate` per second.
+    """
+
+    def __init__(self, rate, burst=None):
+        if burst is None:
+            burst = max(1, rate)
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def consume(self, tokens=1, now=None):
+        """Take `tokens` from the bucket, returning `False` if there aren't enough."""
+
+        if now is None:
+            now = time.time()
+
+        self._lock.acquire()
+        try:
+            elapsed = max(0, now - self._updated)
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+        finally:
+            self._lock.release()
+
+
+class CircuitBreaker(object):
+
+    """
+    Stop calling a failing service for a while, then probe it carefully.
+
+    After `threshold` consecutive failures the breaker opens, and `allow()`
+    refuses everything for `reset_timeout` seconds. After that it's half-open:
+    a single caller is let through as a probe, and the breaker closes again if
+    the probe succeeds or re-opens for another `reset_timeout` if it fails.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self, now=None):
+        """Return `True` if the caller may try the service."""
+
+        if self.state == self.CLOSED:
+            return True
+        if now is None:
+            now = time.time()
+
+        self._lock.acquire()
+        try:
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            # Either still open, or somebody else is already probing.
+            return self.state == self.CLOSED
+        finally:
+            self._lock.release()
+
+    def record_success(self):
+        self._lock.acquire()
+        try:
+            self.state = self.CLOSED
+            self.failures = 0
+        finally:
+            self._lock.release()
+
+    def record_failure(self, now=None):
+        """Count a failure, returning `True` if it made the breaker open."""
+
+        if now is None:
+            now = time.time()
+
+        self._lock.acquire()
+        try:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                    self.state == self.CLOSED and self.failures >= self.threshold):
+                self.state = self.OPEN
+                self._opened_at = now
+                return True
+            return False
+        finally:
+            self._lock.release()
@@ -0,0 +1,203 @@
+"""Transports for sending payloads to the Exceptional API."""
+
+import errno
+import httplib
+import socket
+import threading
+import urlparse
+
+
+class TransportError(Exception):
+
+    """The API answered with a non-2xx status."""
+
+    def __init__(self, status, reason, body=''):
+        Exception.__init__(self, status, reason)
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+    def __str__(self):
+        return "HTTP %d %s" % (self.status, self.reason)
+
+
+class ChunkedBody(object):
+
+    """
+    A request body which is generated piece by piece.
+
+    It's sent with chunked transfer encoding, so it never has to be held in
+    memory all at once. `factory` should return an iterable of bytestrings,
+    and is called afresh each time the body is sent (a request may be retried
+    on a new connection).
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __iter__(self):
+        return iter(self.factory())
+
+
+class _StaleConnection(Exception):
+    """A pooled connection turned out to have been closed by the server."""
+
+
+class HTTPTransport(object):
+
+    """
+    POST payloads over persistent, keep-alive HTTP(S) connections.
+
+    Idle connections are pooled per endpoint host, so each request costs
+    neither a DNS lookup nor a TCP handshake unless the pool is empty. Several
+    threads can share a transport; each takes a connection out of the pool for
+    the duration of a request.
+
+    A request which fails on a pooled connection (most likely because the
+    server has since closed it) is retried once on a fresh one.
+    """
+
+    connection_classes = {
+        'http': httplib.HTTPConnection,
+        'https': httplib.HTTPSConnection,
+    }
+
+    def __init__(self, connect_timeout=5, read_timeout=10, max_idle=4):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def post(self, url, body, headers):
+
+        """
+        POST `body` to `url` and return the response body.
+
+        `body` is either a bytestring or a `ChunkedBody`. Raises
+        `TransportError` for a non-2xx response, and lets socket and `httplib`
+        errors propagate.
+        """
+
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+        if query:
+            path += '?' + query
+        key = (scheme, netloc)
+
+        conn, reused = self._checkout(key)
+        try:
+            status, reason, data, will_close = self._request(conn, path, body, headers,
+                                                             reused)
+        except _StaleConnection:
+            # Whatever killed that connection probably killed its siblings.
+            self.close(key)
+            conn, reused = self._checkout(key)
+            status, reason, data, will_close = self._request(conn, path, body, headers,
+                                                             False)
+
+        if will_close:
+            conn.close()
+        else:
+            self._checkin(key, conn)
+
+        if not 200 <= status < 300:
+            raise TransportError(status, reason, data)
+        return data
+
+    def _request(self, conn, path, body, headers, reused):
+
+        """
+        Send a request and read its response, closing `conn` if that fails.
+
+        If `reused` and the server had evidently closed the connection before
+        it got the request, raises `_StaleConnection` so that it can be
+        retried. Anything else (a timeout in particular) may have happened
+        after the server got the request, so isn't retried.
+        """
+
+        try:
+            try:
+                self._send(conn, path, body, headers)
+            except socket.error, exc:
+                if (reused and not isinstance(exc, socket.timeout) and
+                        exc.args and exc.args[0] in (errno.ECONNRESET, errno.EPIPE)):
+                    raise _StaleConnection(exc)
+                raise
+            try:
+                response = conn.getresponse()
+            except httplib.BadStatusLine, exc:
+                # Hung up without sending a byte (Python 2.7.6 and later say
+                # so; earlier versions report an empty status line).
+                if reused and (exc.line == repr('') or
+                               exc.line.startswith('No status line received')):
+                    raise _StaleConnection(exc)
+                raise
+            data = response.read()
+        except:
+            conn.close()
+            raise
+        return response.status, response.reason, data, response.will_close
+
+    def _send(self, conn, path, body, headers):
+        if conn.sock is None:
+            conn.connect()
+            # The connection was opened with the connect timeout; from here
+            # on we're waiting for the server to respond.
+            conn.sock.settimeout(self.read_timeout)
+        if isinstance(body, basestring):
+            conn.request('POST', path, body, headers)
+        else:
+            conn.putrequest('POST', path, skip_accept_encoding=True)
+            for name, value in headers.items():
+                conn.putheader(name, value)
+            conn.putheader('Transfer-Encoding', 'chunked')
+            conn.endheaders()
+            for chunk in body:
+                if chunk:
+                    conn.send('%x\r\n%s\r\n' % (len(chunk), chunk))
+            conn.send('0\r\n\r\n')
+
+    def _checkout(self, key):
+        self._lock.acquire()
+        try:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        finally:
+            self._lock.release()
+
+        scheme, netloc = key
+        try:
+            conn_class = self.connection_classes[scheme]
+        except KeyError:
+            raise ValueError("Unsupported URL scheme: %r" % (scheme,))
+        return conn_class(netloc, timeout=self.connect_timeout), False
+
+    def _checkin(self, key, conn):
+        self._lock.acquire()
+        try:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        finally:
+            self._lock.release()
+        conn.close()
+
+    def close(self, key=None):
+        """Close idle connections, either for one host or for all of them."""
+
+        self._lock.acquire()
+        try:
+            if key is None:
+                keys = self._idle.keys()
+            else:
+                keys = [key]
+            conns = []
+            for k in keys:
+                conns.extend(self._idle.pop(k, []))
+        finally:
+            self._lock.release()
+
+        for conn in conns:
+            conn.close()
@@ -0,0 +1,124 @@
+"""Trim oversized parts of an error document before it is encoded."""
+
+import datetime
+import decimal
+
+
+# Rough encoded sizes for values whose size we don't bother to measure.
+SCALAR_COST = 8
+OBJECT_COST = 32
+
+SCALAR_TYPES = (bool, int, long, float, type(None))
+OBJECT_TYPES = (datetime.date, datetime.time, decimal.Decimal)
+
+
+def truncate(value, items=None, bytes=None, depth=5, tail=False):
+
+    """
+    Trim a payload section to `items` entries and (roughly) `bytes` bytes.
+
+    Dictionaries and lists (at every level of nesting) are cut down to
+    `items` entries, with a marker recording how many were left out. Strings
+    are cut short once the running total of bytes hits the budget, and
+    containers beyond the budget are dropped entirely; either way the marker
+    says how much is missing. Containers nested more than `depth` deep, and
+    objects JSON can't represent, are replaced by a truncated `repr()`.
+
+    Sizes are measured on the unencoded values, so oversized data is never
+    encoded just to be thrown away. With `tail=True`, long lists keep their
+    last entries rather than their first (as you'd want for a backtrace).
+
+    A limit of `None` means no limit.
+    """
+
+    budget = [bytes]
+    return _truncate(value, items, budget, depth, tail)
+
+
+def _truncate(value, items, budget, depth, tail):
+    if isinstance(value, basestring):
+        return _truncate_string(value, budget)
+    elif isinstance(value, SCALAR_TYPES):
+        _spend(budget, SCALAR_COST)
+        return value
+    elif isinstance(value, OBJECT_TYPES):
+        _spend(budget, OBJECT_COST)
+        return value
+    elif depth <= 0:
+        return _truncate_string(_repr(value), budget)
+    elif isinstance(value, dict):
+        return _truncate_dict(value, items, budget, depth, tail)
+    elif isinstance(value, (list, tuple)):
+        return _truncate_list(value, items, budget, depth, tail)
+    return _truncate_string(_repr(value), budget)
+
+
+def _truncate_dict(value, items, budget, depth, tail):
+    result = {}
+    for i, (key, item) in enumerate(value.iteritems()):
+        if (items is not None and i >= items) or _exhausted(budget):
+            result['__truncated__'] = '%d more items' % (len(value) - i)
+            break
+        if isinstance(key, basestring):
+            _spend(budget, len(key))
+        else:
+            _spend(budget, SCALAR_COST)
+        result[key] = _truncate(item, items, budget, depth - 1, tail)
+    return result
+
+
+def _truncate_list(value, items, budget, depth, tail):
+    value = list(value)
+    skipped = 0
+    if items is not None and len(value) > items:
+        skipped = len(value) - items
+        if tail:
+            value = value[-items:]
+        else:
+            value = value[:items]
+    if tail:
+        # Spend the budget on the entries we care about most.
+        value.reverse()
+
+    result = []
+    for i, item in enumerate(value):
+        if _exhausted(budget):
+            skipped += len(value) - i
+            break
+        result.append(_truncate(item, items, budget, depth - 1, tail))
+
+    if tail:
+        result.reverse()
+    if skipped:
+        marker = '...[%d more items]' % skipped
+        if tail:
+            result.insert(0, marker)
+        else:
+            result.append(marker)
+    return result
+
+
+def _truncate_string(value, budget):
+    if budget[0] is None:
+        return value
+    remaining = max(0, budget[0])
+    _spend(budget, len(value))
+    if len(value) <= remaining:
+        return value
+    return value[:remaining] + '...[%d more characters]' % (len(value) - remaining)
+
+
+def _spend(budget, amount):
+    if budget[0] is not None:
+        budget[0] -= amount
+
+
+def _exhausted(budget):
+    return budget[0] is not None and budget[0] <= 0
+
+
+def _repr(value):
+    try:
+        return repr(value)
+    except Exception:
+        return object.__repr__(value)
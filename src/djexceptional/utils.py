@@ -1,13 +1,20 @@
 import datetime
 import decimal
-import re
+import threading
+import time
+import weakref
 
 from django.utils import datetime_safe
 from django.utils import simplejson
 
 
 class ResilientJSONEncoder(simplejson.JSONEncoder):
-    """A JSON encoder (with support for dates/times) that should never fail."""
+
+    """
+    A JSON encoder (with support for dates/times) that should never fail.
+
+    Objects with a `for_json()` method are encoded as whatever it returns.
+    """
 
     DATE_FORMAT = "%Y-%m-%d"
     TIME_FORMAT = "%H:%M:%S"
@@ -23,6 +30,8 @@ class ResilientJSONEncoder(simplejson.JSONEncoder):
             return o.strftime(self.TIME_FORMAT)
         elif isinstance(o, decimal.Decimal):
             return str(o)
+        elif hasattr(o, 'for_json'):
+            return o.for_json()
         else:
             try:
                 return super(ResilientJSONEncoder, self).default(o)
@@ -36,37 +45,444 @@ def json_dumps(obj):
     return simplejson.dumps(obj, cls=ResilientJSONEncoder)
 
 
-def meta_to_http(meta):
-    """Convert a request.META into a dictionary of HTTP headers."""
+def json_iterencode(obj):
+    """Encode an object as JSON a piece at a time, using the resilient encoder."""
+
+    return ResilientJSONEncoder().iterencode(obj)
+
+
+class HeaderTranslator(object):
+
+    """
+    Convert `request.META` dictionaries into dictionaries of HTTP headers.
+
+    The header name for each META key (or the fact that it isn't a header
+    we want) is worked out the first time the key is seen and remembered
+    after that, for up to `max_keys` keys so that clients sending made-up
+    headers can't grow the table without limit.
+
+    `allow`, if given, is the collection of header names to keep; any header
+    in `deny` is dropped. Both are case-insensitive, and since the verdict
+    is remembered, an unwanted header costs just one dictionary lookup.
+    """
+
+    def __init__(self, allow=None, deny=(), max_keys=1000):
+        self.allow = allow
+        if allow is not None:
+            self.allow = set(name.lower() for name in allow)
+        self.deny = set(name.lower() for name in deny)
+        self.max_keys = max_keys
+        self._names = {}
+
+    def __call__(self, meta):
+        names = self._names
+        headers = {}
+        for key in meta:
+            try:
+                header = names[key]
+            except KeyError:
+                header = self.translate(key)
+            if header is not None:
+                headers[header] = meta[key]
+        return headers
+
+    def translate(self, key):
+        """Return the header name for a META key, or `None` to skip it."""
 
-    headers = {}
-    for key in meta:
         if key.startswith("HTTP_"):
             # A heuristic; HTTP_X_FORWARDED_FOR => X-Forwarded-For
-            header = re.sub(r'^HTTP_', '', key)
-            header = key.replace("_", " ").title().replace(" ", "-")
-        elif key in ["CONTENT_LENGTH", "CONTENT_TYPE"]:
+            header = key[5:].replace("_", " ").title().replace(" ", "-")
+        elif key in ("CONTENT_LENGTH", "CONTENT_TYPE"):
             header = key.replace("_", " ").title().replace(" ", "-")
         else:
-            continue
-        headers[header] = meta[key]
-    return headers
+            header = None
+
+        if header is not None:
+            lowered = header.lower()
+            if lowered in self.deny or (self.allow is not None and
+                                        lowered not in self.allow):
+                header = None
+
+        # Races between threads here are harmless; they'd store the same value.
+        if len(self._names) < self.max_keys:
+            self._names[key] = header
+        return header
+
+
+_translate_headers = HeaderTranslator()
+
+
+def meta_to_http(meta):
+    """Convert a request.META into a dictionary of HTTP headers."""
+
+    return _translate_headers(meta)
 
 
-def memoize(func):
-    """A simple memoize decorator (with no support for keyword arguments)."""
+def memoize(func=None, maxsize=128, ttl=None):
 
-    cache = {}
-    def wrapper(*args):
-        if args in cache:
-            return cache[args]
-        cache[args] = value = func(*args)
+    """
+    A memoize decorator, backed by a bounded, thread-safe cache.
+
+    Use it bare (`@memoize`) or with options (`@memoize(maxsize=10, ttl=60)`).
+    Results are cached on the positional and keyword arguments, at most
+    `maxsize` of them (the least recently used are evicted first), and for at
+    most `ttl` seconds if that's given. Calls with unhashable arguments aren't
+    cached.
+
+    If the first argument (such as the `self` of a method) can be weakly
+    referenced, it's held weakly, with its own cache of up to `maxsize`
+    results for the rest of the arguments, so an object's cached results die
+    with it rather than pinning it in memory.
+
+    The wrapper has a `clear()` method to empty the cache, an
+    `on_clear(callback)` method to register functions (such as the `clear()`
+    of another memoized function derived from this one) to be called
+    whenever it is cleared, and a `stats()` method returning the hit and
+    miss counts and the number of cached results.
+    """
+
+    if func is None:
+        return lambda func: memoize(func, maxsize, ttl)
+
+    cache = MemoCache(maxsize, ttl)
+    callbacks = []
+    def wrapper(*args, **kwargs):
+        value = cache.get(args, kwargs)
+        if value is _MISSING:
+            value = func(*args, **kwargs)
+            cache.put(args, kwargs, value)
         return value
 
+    def clear():
+        cache.clear()
+        for callback in callbacks:
+            callback()
+
     wrapper.__name__ = func.__name__
     wrapper.__doc__ = func.__doc__
     if hasattr(func, '__module__'):
         wrapper.__module__ = func.__module__
-    wrapper.clear = cache.clear
+    wrapper.clear = clear
+    wrapper.on_clear = callbacks.append
+    wrapper.stats = cache.stats
 
     return wrapper
+
+
+class MemoCache(object):
+
+    """The cache behind `memoize`; `get()` returns `_MISSING` on a miss."""
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._weak = weakref.WeakKeyDictionary()
+        self._strong = LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, args, kwargs):
+        try:
+            cache, key = self._locate(args, kwargs, False)
+            entry = cache.get(key, _MISSING)
+        except TypeError:  # Unhashable.
+            entry = _MISSING
+
+        # Like `WeakKeyCache`, the counts aren't locked; they're only a guide.
+        if entry is not _MISSING:
+            value, expires = entry
+            if expires is None or time.time() < expires:
+                self.hits += 1
+                return value
+        self.misses += 1
+        return _MISSING
+
+    def put(self, args, kwargs, value):
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        try:
+            cache, key = self._locate(args, kwargs, True)
+            cache.put(key, (value, expires))
+        except TypeError:
+            pass
+
+    def stats(self):
+        self._lock.acquire()
+        try:
+            size = len(self._strong)
+            for cache in self._weak.values():
+                size += len(cache)
+        finally:
+            self._lock.release()
+        return {'hits': self.hits, 'misses': self.misses, 'size': size}
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._weak.clear()
+            self._strong.clear()
+            self.hits = self.misses = 0
+        finally:
+            self._lock.release()
+
+    def _locate(self, args, kwargs, create):
+
+        """
+        Return the cache an entry belongs in, and its key there.
+
+        Raises `TypeError` if the arguments can't be used as a key.
+        """
+
+        key = args
+        if kwargs:
+            key = args + (_KWARGS,) + tuple(sorted(kwargs.items()))
+        if args:
+            try:
+                cache = self._weak.get(args[0])
+            except TypeError:  # Can't be weakly referenced.
+                pass
+            else:
+                if cache is None:
+                    if not create:
+                        return _EMPTY, None
+                    self._lock.acquire()
+                    try:
+                        cache = self._weak.get(args[0])
+                        if cache is None:
+                            cache = self._weak[args[0]] = LRUCache(self.maxsize)
+                    finally:
+                        self._lock.release()
+                return cache, key[1:]
+        return self._strong, key
+
+
+def splice_json(fragment, obj_json):
+
+    """
+    Insert pre-encoded JSON object members into an encoded JSON object.
+
+        >>> splice_json('"a": 1', '{"b": 2}')
+        '{"a": 1, "b": 2}'
+    """
+
+    if obj_json == '{}':
+        return '{' + fragment + '}'
+    return '{' + fragment + ', ' + obj_json[1:]
+
+
+class Counters(object):
+
+    """A thread-safe set of named integer counters."""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        self._lock.acquire()
+        try:
+            self._counts[name] = self._counts.get(name, 0) + amount
+        finally:
+            self._lock.release()
+
+    def __getitem__(self, name):
+        return self._counts.get(name, 0)
+
+    def snapshot(self):
+        """Return a copy of the counters as a plain dictionary."""
+
+        self._lock.acquire()
+        try:
+            return dict(self._counts)
+        finally:
+            self._lock.release()
+
+
+class LRUCache(object):
+
+    """
+    A thread-safe mapping which holds at most `maxsize` items.
+
+    Reading or writing a key makes it the most recently used; adding a key to
+    a full cache evicts the least recently used one. Entries are kept in a
+    circular doubly-linked list of `[prev, next, key, value]` links, so every
+    operation is O(1).
+    """
+
+    PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._links = {}
+        self._root = root = []
+        root[:] = [root, root, None, None]
+        # Not an `RLock`; in Python 2 that's written in Python, and it's slow.
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, key):
+        return key in self._links
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is None:
+                return default
+            if link is not self._root[self.PREV]:
+                self._unlink(link)
+                self._append(link)
+            return link[self.VALUE]
+        finally:
+            self._lock.release()
+
+    def put(self, key, value):
+        """Store `value`, returning the evicted `(key, value)` pair, if any."""
+
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is not None:
+                self._unlink(link)
+                link[self.VALUE] = value
+                self._append(link)
+                return None
+
+            evicted = None
+            if len(self._links) >= self.maxsize:
+                oldest = self._root[self.NEXT]
+                self._unlink(oldest)
+                del self._links[oldest[self.KEY]]
+                evicted = (oldest[self.KEY], oldest[self.VALUE])
+
+            link = [None, None, key, value]
+            self._append(link)
+            self._links[key] = link
+            return evicted
+        finally:
+            self._lock.release()
+
+    def pop(self, key, default=None):
+        self._lock.acquire()
+        try:
+            link = self._links.pop(key, None)
+            if link is None:
+                return default
+            self._unlink(link)
+            return link[self.VALUE]
+        finally:
+            self._lock.release()
+
+    def items(self):
+        """Return a list of `(key, value)` pairs, least recently used first."""
+
+        self._lock.acquire()
+        try:
+            items = []
+            link = self._root[self.NEXT]
+            while link is not self._root:
+                items.append((link[self.KEY], link[self.VALUE]))
+                link = link[self.NEXT]
+            return items
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._links.clear()
+            self._root[:] = [self._root, self._root, None, None]
+        finally:
+            self._lock.release()
+
+    def _unlink(self, link):
+        prev, next = link[self.PREV], link[self.NEXT]
+        prev[self.NEXT] = next
+        next[self.PREV] = prev
+
+    def _append(self, link):
+        root = self._root
+        last = root[self.PREV]
+        link[self.PREV], link[self.NEXT] = last, root
+        last[self.NEXT] = root[self.PREV] = link
+
+
+class WeakKeyCache(object):
+
+    """
+    Cache the results of a function of one argument, keyed on the argument.
+
+    Arguments which can be weakly referenced are held in a
+    `WeakKeyDictionary`, so their entries disappear along with them (a view
+    created per request, or replaced by a code reload, doesn't leak). Others
+    go in an `LRUCache`. Each side holds at most `maxsize` entries; once the
+    weak side is full, new results there are simply not cached. Unhashable
+    arguments are never cached.
+
+    `stats()` returns the hit and miss counts, and the number of entries.
+    """
+
+    def __init__(self, func, maxsize=1000):
+        self.func = func
+        self.maxsize = maxsize
+        self._weak = weakref.WeakKeyDictionary()
+        self._strong = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def __call__(self, key):
+        try:
+            value = self._weak.get(key, _MISSING)
+            if value is _MISSING:
+                value = self._strong.get(key, _MISSING)
+        except TypeError:  # Unhashable, or can't be weakly referenced.
+            value = self._strong.get(key, _MISSING)
+
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = self.func(key)
+        self._store(key, value)
+        return value
+
+    def _store(self, key, value):
+        self._lock.acquire()
+        try:
+            try:
+                if len(self._weak) < self.maxsize:
+                    self._weak[key] = value
+                return
+            except TypeError:
+                pass
+        finally:
+            self._lock.release()
+
+        try:
+            self._strong.put(key, value)
+        except TypeError:
+            pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._weak) + len(self._strong)}
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._weak.clear()
+            self._strong.clear()
+            self.hits = self.misses = 0
+        finally:
+            self._lock.release()
+
+
+_MISSING = object()
+# Separates positional from keyword arguments in `memoize` keys.
+_KWARGS = object()
+# Stands in for the cache of an object which doesn't have one yet.
+_EMPTY = {}
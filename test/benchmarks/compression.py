@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+"""
+Compare the compression codecs on realistic error reports.
+
+For each size of report, prints the compressed size and the CPU time taken
+to compress it with each codec and level, so the trade-off between CPU and
+bandwidth can be made on data. Run it as `python test/benchmarks/compression.py`.
+"""
+
+import payloads
+
+from djexceptional.compression import DEFAULT_DICTIONARY, get_codec
+
+
+def codecs(middleware):
+    environment = '{' + middleware.environment_json() + '}'
+    return [
+        ('none', get_codec('none')),
+        ('gzip-1', get_codec('gzip', 1)),
+        ('gzip-6', get_codec('gzip', 6)),
+        ('gzip-9', get_codec('gzip', 9)),
+        ('deflate-1', get_codec('deflate', 1)),
+        ('deflate-6', get_codec('deflate', 6)),
+        ('deflate-1+keys', get_codec('deflate', 1, DEFAULT_DICTIONARY)),
+        ('deflate-6+keys', get_codec('deflate', 6, DEFAULT_DICTIONARY)),
+        ('deflate-1+keys+env', get_codec('deflate', 1, DEFAULT_DICTIONARY + environment)),
+        ('deflate-6+keys+env', get_codec('deflate', 6, DEFAULT_DICTIONARY + environment)),
+    ]
+
+
+def main(number=200):
+    middleware = payloads.make_middleware()
+    print "%-8s %-20s %10s %8s %12s" % ("size", "codec", "bytes", "ratio", "cpu/payload")
+    for size, items in payloads.SIZES:
+        payload = middleware.serialize(payloads.make_document(middleware, items))
+        for name, codec in codecs(middleware):
+            compressed = codec.compress(payload)
+            seconds = payloads.timeit(lambda: codec.compress(payload), number)
+            print "%-8s %-20s %10d %7.1f%% %10.1fus" % (
+                size, name, len(compressed),
+                100.0 * len(compressed) / len(payload), seconds * 1e6)
+        print
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""
+Measure what reporting an error costs, stage by stage.
+
+For each size of request and each of the example project's views, prints
+the time taken by `environment_info()` (on a cold and a warm cache),
+`request_info()`, `exception_info()`, `json_dumps()`, the middleware's own
+`serialize()` and `compress()`, and the whole of `process_exception()`
+POSTing to a local stand-in endpoint. Beside each are the peak and net
+numbers of garbage-collected objects allocated along the way.
+
+Stage times are CPU time; end-to-end time is wall-clock, since it includes
+the round trip. The end-to-end allocation counts include the stand-in
+endpoint's, which runs in the same process. Run it as
+`python test/benchmarks/hotpath.py`.
+"""
+
+import BaseHTTPServer
+import gc
+import sys
+import threading
+import time
+
+import payloads
+
+from djexceptional.utils import json_dumps
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    """Accepts any POST, over a keep-alive connection."""
+
+    protocol_version = 'HTTP/1.1'
+    # Send each response in one piece; line by line, it's held up by the
+    # interaction of Nagle's algorithm with delayed ACKs.
+    wbufsize = -1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_endpoint():
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    return server, 'http://127.0.0.1:%d/api/errors?api_key=benchmark&protocol_version=6' % (
+        server.server_port,)
+
+
+def allocations(func):
+
+    """
+    Count the garbage-collected objects allocated by a call to `func()`.
+
+    Returns the peak number alive at once during the call (sampled at every
+    function call and return) and the number still alive after it, less
+    those the measurement itself allocates.
+    """
+
+    baseline = _allocations(lambda: None)
+    peak, net = _allocations(func)
+    return peak - baseline[0], net - baseline[1]
+
+
+def _allocations(func):
+    func()  # Warm any caches.
+    gc.collect()
+    gc.disable()
+    try:
+        start = gc.get_count()[0]
+        peak = [start]
+        def profile(frame, event, arg):
+            count = gc.get_count()[0]
+            if count > peak[0]:
+                peak[0] = count
+        sys.setprofile(profile)
+        try:
+            func()
+        finally:
+            sys.setprofile(None)
+        end = gc.get_count()[0]
+    finally:
+        gc.enable()
+    return peak[0] - start, end - start
+
+
+def stages(middleware, request, view):
+    exc, tb = payloads.raise_from(view, request)
+    document = {}
+    document.update(middleware.request_info(request))
+    document.update(middleware.exception_info(exc, tb))
+    serialized = middleware.serialize(document)
+
+    def cold_environment():
+        middleware.environment_info.clear()
+        middleware.environment_info()
+
+    def end_to_end():
+        try:
+            view(request)
+        except Exception, exc:
+            middleware.process_exception(request, exc)
+
+    return document, serialized, [
+        ('environment_info (cold)', cold_environment, None),
+        ('environment_info', middleware.environment_info, None),
+        ('request_info', lambda: middleware.request_info(request), None),
+        ('exception_info', lambda: middleware.exception_info(exc, tb), None),
+        ('json_dumps', lambda: json_dumps(document), None),
+        ('serialize', lambda: middleware.serialize(document), None),
+        ('compress', lambda: middleware.codec.compress(serialized), None),
+        ('end-to-end', end_to_end, time.time),
+    ]
+
+
+def main(number=100):
+    server, url = start_endpoint()
+    middleware = payloads.make_middleware()
+    middleware.api_endpoint = url
+    try:
+        for size, items in payloads.SIZES:
+            for path, view in payloads.VIEWS:
+                request = payloads.make_request(path, items)
+                document, serialized, timings = stages(middleware, request, view)
+                print "%s request, %s view: %d bytes, %d compressed" % (
+                    size, '.'.join(middleware.get_view_name(view)),
+                    len(serialized), len(middleware.codec.compress(serialized)))
+                print "  %-24s %12s %10s %10s" % ("stage", "time", "peak objs", "net objs")
+                for name, func, timer in timings:
+                    seconds = payloads.timeit(func, number, timer)
+                    peak, net = allocations(func)
+                    print "  %-24s %10.1fus %10d %10d" % (name, seconds * 1e6, peak, net)
+                print
+        stats = middleware.stats()
+        if stats['failed'] or stats['suppressed']:
+            print "Warning: not every report reached the endpoint: %r" % (stats,)
+    finally:
+        middleware.transport.close()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
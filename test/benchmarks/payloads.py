@@ -0,0 +1,118 @@
+"""
+Realistic error documents for the benchmarks, built by the real middleware.
+
+Importing this sets up the example project in `test/example`.
+"""
+
+from cStringIO import StringIO
+
+import datetime
+import decimal
+import os
+import sys
+import urllib
+
+
+TEST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE_DIR = os.path.join(TEST_DIR, 'example')
+
+sys.path.insert(0, TEST_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(TEST_DIR), 'src'))
+os.chdir(EXAMPLE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'example.settings')
+
+from django.core.handlers.wsgi import WSGIRequest
+
+from djexceptional import ExceptionalMiddleware
+from example import urls
+
+
+# The number of POST parameters and session keys in each size of request.
+SIZES = [('small', 2), ('medium', 50), ('large', 1000)]
+
+VIEWS = [
+    ('/', urls.just_raise),
+    ('/class/', urls.urlpatterns[1].callback),
+    ('/method/', urls.urlpatterns[2].callback),
+]
+
+
+def make_request(path='/', items=2):
+    """Build a POST request with `items` form fields and session keys."""
+
+    body = urllib.urlencode([('field_%d' % i, 'value %d ' % i * 8)
+                             for i in range(items)])
+    request = WSGIRequest({
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': path,
+        'QUERY_STRING': 'page=2&sort=name',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'REMOTE_ADDR': '127.0.0.1',
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': str(len(body)),
+        'HTTP_HOST': 'testserver',
+        'HTTP_USER_AGENT': 'Mozilla/5.0 (X11; Linux x86_64) benchmark',
+        'HTTP_ACCEPT': 'text/html,application/xhtml+xml;q=0.9,*/*;q=0.8',
+        'HTTP_ACCEPT_LANGUAGE': 'en-gb,en;q=0.5',
+        'HTTP_COOKIE': 'sessionid=0123456789abcdef; csrftoken=fedcba9876543210',
+        'HTTP_X_FORWARDED_FOR': '10.0.0.1, 10.0.0.2',
+        'wsgi.input': StringIO(body),
+        'wsgi.url_scheme': 'http',
+    })
+    request.session = dict(('session_%d' % i, {
+        'id': i,
+        'name': 'item %d' % i,
+        'tags': ['a', 'b', 'c'],
+        'price': decimal.Decimal('%d.99' % i),
+        'updated': datetime.datetime(2010, 1, 1, 12, 0, i % 60),
+    }) for i in range(items))
+    return request
+
+
+def raise_from(view, request):
+    """Call a view which raises, returning the exception and its traceback."""
+
+    try:
+        view(request)
+    except Exception, exc:
+        return exc, sys.exc_info()[2]
+    raise AssertionError("%r didn't raise" % (view,))
+
+
+def make_middleware():
+    return ExceptionalMiddleware()
+
+
+def make_document(middleware, items=2, path='/', view=urls.just_raise):
+    """Build the error document the middleware would report for `view`."""
+
+    request = make_request(path, items)
+    exc, tb = raise_from(view, request)
+    document = {}
+    document.update(middleware.request_info(request))
+    document.update(middleware.exception_info(exc, tb))
+    return document
+
+
+def timeit(func, number, timer=None):
+
+    """
+    Return the mean time of calling `func()` `number` times, in seconds.
+
+    That's CPU time, unless another `timer` (such as `time.time`) is given.
+    """
+
+    if timer is None:
+        timer = time_func
+    func()  # Warm any caches.
+    start = timer()
+    for i in xrange(number):
+        func()
+    return (timer() - start) / number
+
+
+if sys.platform == 'win32':
+    from time import time as time_func
+else:
+    from time import clock as time_func
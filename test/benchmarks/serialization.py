@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+"""
+Compare the JSON serializers on realistic error reports.
+
+For each size of report, prints the CPU time taken to encode it with the
+resilient (pure-Python `default()` hook) and fast (C-accelerated) backends.
+Run it as `python test/benchmarks/serialization.py`.
+"""
+
+import payloads
+
+from djexceptional.serializers import FastSerializer, ResilientSerializer
+
+
+def main(number=200):
+    middleware = payloads.make_middleware()
+    fast = FastSerializer()
+    resilient = ResilientSerializer()
+    library = fast.library and fast.library.__name__ or 'none available'
+    print "Fast JSON library: %s" % (library,)
+    print "%-8s %10s %12s %12s %8s" % ("size", "bytes", "resilient", "fast", "speedup")
+    for size, items in payloads.SIZES:
+        document = payloads.make_document(middleware, items)
+        assert fast.dumps(document) == resilient.dumps(document)
+        slow_time = payloads.timeit(lambda: resilient.dumps(document), number)
+        fast_time = payloads.timeit(lambda: fast.dumps(document), number)
+        print "%-8s %10d %10.1fus %10.1fus %7.2fx" % (
+            size, len(fast.dumps(document)), slow_time * 1e6, fast_time * 1e6,
+            slow_time / fast_time)
+
+
+if __name__ == '__main__':
+    main()
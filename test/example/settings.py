@@ -60,7 +60,13 @@ ADMIN_MEDIA_PREFIX = '/media/'
 # Make this unique, and don't share it with anybody.
 SECRET_KEY = '8@+k3lm3=s+ml6_*(cnpbg1w=6k9xpk5f=irs+&j4_6i=62fy^'
 
-EXCEPTIONAL_API_KEY = open("exceptional.key").read().strip()
+# Write your API key to `exceptional.key` to send errors to Exceptional; the
+# tests and benchmarks don't need one.
+try:
+    EXCEPTIONAL_API_KEY = open(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                            "exceptional.key")).read().strip()
+except IOError:
+    EXCEPTIONAL_API_KEY = "testkey"
 
 # List of callables that know how to import templates from various sources.
 TEMPLATE_LOADERS = (